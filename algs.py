@@ -1,4 +1,8 @@
+from time import time
+
 import node_util
+from physics import PIPE_GAP_SIZE
+import structs
 
 
 class Fringe:
@@ -10,10 +14,28 @@ class Fringe:
     def __init__(self, s):
         self.structure = s()
         assert ('push' in dir(s) and 'pop' in dir(s) and 'isEmpty' in dir(s))
+        # Stack, Queue and PriorityQueueWithFunction take items alone
+        self.prioritized = isinstance(self.structure, structs.PriorityQueue) and \
+            not isinstance(self.structure, structs.PriorityQueueWithFunction)
+        # priority queues that support decrease-key re-prioritize an item
+        # already on the fringe instead of queueing it a second time
+        self.prioritize = getattr(self.structure, 'update', None)
 
     def push(self, item, base, cost):
-        self.structure.push(item) if cost == 0 else self.structure.push(
-            item, base + cost)
+        if not self.prioritized:
+            self.structure.push(item)
+        elif self.prioritize:
+            self.prioritize(item, base + cost)
+        else:
+            self.structure.push(item, base + cost)
+
+    def push_many(self, items, base, costs):
+        # containers without priorities take a whole batch in one call
+        if not self.prioritized and getattr(self.structure, 'push_many', None):
+            self.structure.push_many(items)
+        else:
+            for item, cost in zip(items, costs):
+                self.push(item, base, cost)
 
     def pop(self):
         return self.structure.pop()
@@ -22,48 +44,143 @@ class Fringe:
         return self.structure.isEmpty()
 
 
-def search(structure, num_pipes, cost_function=None):
+def search(structure, num_pipes, cost_function=None, macro=None, start=None, goal=None, deadline=None, margin=0):
     """fringe-agnostic graph search problem. Inputs are the type of fringe, number of
     pipes to solve, and cost function for a node (constant for UCS,
-    heuristic for A*)"""
+    heuristic for A*). The fringe only holds states; each state's best known
+    predecessor is kept in a parent table and the action list is rebuilt
+    once, at the goal.
+
+    With macro=k, nodes are expanded with the macro-actions of
+    node_util.getMacroSuccessors rather than frame by frame; the returned
+    path is still one action per frame.
+
+    start is the FB_State to search from, the start of the game by default,
+    and goal(state) replaces node_util.isGoalState(state, num_pipes).
+    A margin makes the bird crash wherever it would with its y that many
+    pixels higher or lower (see node_util.advance).
+    Returns (path, expanded), or None if no state with num_pipes is reachable
+    or the search is still running at time() deadline."""
 
     if cost_function is None:
-        def cost_function():
+        def cost_function(successor):
             return 0
 
+    if goal is None:
+        def goal(state):
+            return node_util.isGoalState(state, num_pipes)
+
+    if macro:
+        def getSuccessors(state):
+            return node_util.getMacroSuccessors(state, macro, margin)
+    elif margin:
+        def getSuccessors(state):
+            return node_util.getSuccessors(state, margin)
+    else:
+        getSuccessors = node_util.getSuccessors
+
     fringe = Fringe(structure)
     visited = {}
-    start = node_util.getStart()
+    parents = {}
+    start = node_util.getStart() if start is None else node_util.Node(start)
     visited[start.state] = 0
 
-    for successor in node_util.getSuccessors(start.state):
-        fringe.push((successor.state, [successor.flapped]),
-                    successor.cost, cost_function(successor))
+    for successor in getSuccessors(start.state):
+        fringe.push(successor.state, successor.cost, cost_function(successor))
         # _update best cost to successors
         visited[successor.state] = successor.cost
+        parents[successor.state] = (start.state, successor.flapped)
     called = 0
     while not fringe.isEmpty():
         called += 1
+        if deadline is not None and called % 1024 == 0 and time() > deadline:
+            return None
         cur = fringe.pop()
-        if node_util.isGoalState(cur[0], num_pipes):
-            return cur[1], called
+        if goal(cur):
+            return reconstruct_path(parents, cur), called
         else:
-            for successor in node_util.getSuccessors(cur[0]):
+            # successors to push, and their costs
+            states, costs = [], []
+            for successor in getSuccessors(cur):
                 # process neighbors
-                if successor.state in visited and visited[successor.state] > (visited[cur[0]] + successor.cost):
+                if successor.state in visited and visited[successor.state] > (visited[cur] + successor.cost):
                     # better path to visitor than found before, update and push to fringe
-                    curpath = cur[1]
-                    newpath = curpath + [successor.flapped]
-                    fringe.push((successor.state, newpath), visited[
-                        cur[0]], cost_function(successor))
-                    visited[successor.state] = visited[cur[0]] + successor.cost
+                    parents[successor.state] = (cur, successor.flapped)
+                    states.append(successor.state)
+                    costs.append(cost_function(successor))
+                    visited[successor.state] = visited[cur] + successor.cost
                 elif successor.state not in visited:
                     # never seen it before, initialize node and push onto fringe
-                    curpath = cur[1]
-                    newpath = curpath + [successor.flapped]
-                    visited[successor.state] = visited[cur[0]] + successor.cost
-                    fringe.push((successor.state, newpath), visited[
-                        cur[0]], cost_function(successor))
+                    parents[successor.state] = (cur, successor.flapped)
+                    visited[successor.state] = visited[cur] + successor.cost
+                    states.append(successor.state)
+                    costs.append(cost_function(successor))
+            fringe.push_many(states, visited[cur], costs)
+
+
+def weighted_astar(num_pipes, epsilon=2.0, macro=None, deadline=None, margin=0):
+    """A* on f = frames + epsilon * heuristic. The priority of search() with
+    the plain heuristic has no path cost at all, so it is greedy best-first;
+    epsilon trades between that and breadth-first order."""
+    return search(structs.PriorityQueue, num_pipes,
+                  lambda successor: successor.state.frame + epsilon * heuristic(successor),
+                  macro=macro, deadline=deadline, margin=margin)
+
+
+def beam_search(num_pipes, width=20, deadline=None):
+    """keeps only the `width` states nearest their gap (beam_heuristic) at
+    each frame, so work grows linearly with the number of frames.
+    Incomplete: returns None when every state in the beam crashes, as well
+    as at the deadline."""
+    parents = {}
+    beam = [node_util.getStart().state]
+    called = 0
+    while beam:
+        if deadline is not None and time() > deadline:
+            return None
+        layer = []
+        for cur in beam:
+            called += 1
+            for successor in node_util.getSuccessors(cur):
+                if successor.state.crashed or successor.state in parents:
+                    continue
+                parents[successor.state] = (cur, successor.flapped)
+                if node_util.isGoalState(successor.state, num_pipes):
+                    return reconstruct_path(parents, successor.state), called
+                layer.append(successor)
+        layer.sort(key=beam_heuristic)
+        beam = [successor.state for successor in layer[:width]]
+    return None
+
+
+def anytime_search(num_pipes, seconds, epsilon=2.0, macro=None):
+    """yields (path, expanded, margin) for as long as `seconds` allows, each
+    solution safer than the last: all frames clear the pipes, the ground and
+    the top of the screen with the bird `margin` pixels higher or lower.
+    Path lengths are fixed by num_pipes, so clearance is what can improve."""
+    deadline = time() + seconds
+    margin = 0
+    while True:
+        found = weighted_astar(num_pipes, epsilon, macro, deadline, margin)
+        if found is None:
+            return
+        yield found[0], found[1], margin
+        margin += 1
+
+
+def reconstruct_path(parents, state):
+    """follows parent pointers back from state to the start state, returning
+    the actions (flapped or not) that lead from the start to state, one per
+    frame. Macro-actions are tuples of actions and are expanded in place."""
+    path = []
+    while state in parents:
+        state, flapped = parents[state]
+        if isinstance(flapped, tuple):
+            path.extend(reversed(flapped))
+        else:
+            path.append(flapped)
+    path.reverse()
+    return path
 
 
 def heuristic(state):
@@ -71,11 +188,24 @@ def heuristic(state):
     admissible for the purposes of A*."""
     state = state.state
     playerMidPos = state.x + node_util.IMAGES['player'][0].get_width() / 2
-    for upipe, lpipe in zip(state.upipes, state.lpipes):
+    for x, k in state.pipes:
         # for loop functions to isolate the first pipe ahead of the agent and
         # exclude those pipes that are behind the agent
-        pipeMidPos = upipe['x'] + node_util.IMAGES['pipe'][0].get_width() / 2
+        pipeMidPos = x + node_util.IMAGES['pipe'][0].get_width() / 2
         if pipeMidPos > playerMidPos:
 
-            y_coord = lpipe['y'] - node_util.PIPE_GAP_SIZE + 37
+            y_coord = node_util.PIPES[k][1]['y'] - PIPE_GAP_SIZE + 37
             return abs(state.y - y_coord) + abs(state.x - pipeMidPos) - (state.score * 1000)
+
+
+def beam_heuristic(state):
+    """vertical distance from the bird's middle to the middle of the first gap
+    it has not cleared yet. Unlike heuristic, it keeps aiming at a pipe
+    until the bird is out of it, not just past its midpoint; every state of
+    a beam is at the same frame, so the horizontal term would not rank them."""
+    state = state.state
+    pipeWidth = node_util.IMAGES['pipe'][0].get_width()
+    playerMid = state.y + node_util.IMAGES['player'][0].get_height() / 2
+    for x, k in state.pipes:
+        if x + pipeWidth > state.x:
+            return abs(playerMid - (node_util.PIPES[k][1]['y'] - PIPE_GAP_SIZE / 2))
@@ -1,7 +1,10 @@
 from time import time
 import algs
+import node_util
 import structs
 
+node_util.initialize()
+
 with open("timing.out", 'w') as f:
     i = 20
     while i <= 450:
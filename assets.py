@@ -0,0 +1,130 @@
+"""Sprite sizes and hitmasks without pygame.
+
+Search, training and the benchmarks only need the sizes of the sprites and
+the alpha masks of the bird and the pipes. SPRITES_FILE, committed next to
+the sprites, holds them pre-extracted: for every image in assets/sprites its
+SHA-1, width and height, and for the bird and pipe sprites the Mask rows.
+Loading it takes a JSON read and no display, so node_util.initialize()
+works on machines without pygame.
+
+When a sprite no longer matches its SHA-1 the file is rebuilt, which does
+need pygame:
+
+    python assets.py build
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+from collision import Mask, mask_from_surface
+
+ASSETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+SPRITES = os.path.join(ASSETS, 'sprites')
+SPRITES_FILE = os.path.join(ASSETS, 'sprites.json')
+
+PLAYER = ('bluebird-upflap.png', 'bluebird-midflap.png', 'bluebird-downflap.png')
+PIPE = 'pipe-green.png'
+
+_sprites = None
+
+
+class Sprite:
+    """the size and mask of a sprite, standing in for the pygame surfaces
+    node_util.IMAGES held"""
+
+    def __init__(self, width, height, mask=None):
+        self.width = width
+        self.height = height
+        self.mask = mask
+
+    def get_width(self):
+        return self.width
+
+    def get_height(self):
+        return self.height
+
+    def rotated(self):
+        """the sprite turned by 180 degrees, as pygame.transform.rotate does"""
+        mask = self.mask
+        if mask is not None:
+            reverse = lambda row: int(bin(row)[2:].zfill(mask.width)[::-1], 2)
+            mask = Mask(mask.width, mask.height, [reverse(row) for row in reversed(mask.rows)])
+        return Sprite(self.width, self.height, mask)
+
+
+def _digest(name):
+    with open(os.path.join(SPRITES, name), 'rb') as infile:
+        return hashlib.sha1(infile.read()).hexdigest()
+
+
+def build():
+    """extracts every sprite with pygame and writes SPRITES_FILE"""
+    import pygame
+
+    sprites = {}
+    for name in sorted(os.listdir(SPRITES)):
+        if not name.endswith('.png'):
+            continue
+        image = pygame.image.load(os.path.join(SPRITES, name))
+        entry = {'sha1': _digest(name), 'width': image.get_width(), 'height': image.get_height()}
+        if name in PLAYER or name == PIPE:
+            entry['rows'] = mask_from_surface(image).rows
+        sprites[name] = entry
+
+    # a temporary file of its own, as pool workers may rebuild at once
+    fd, tmp = tempfile.mkstemp(dir=ASSETS, prefix='.sprites.')
+    with os.fdopen(fd, 'w') as outfile:
+        json.dump(sprites, outfile, sort_keys=True, indent=0)
+    os.chmod(tmp, 0o644)
+    os.rename(tmp, SPRITES_FILE)
+    return sprites
+
+
+def _load():
+    global _sprites
+    if _sprites is None:
+        sprites = None
+        if os.path.isfile(SPRITES_FILE):
+            with open(SPRITES_FILE) as infile:
+                sprites = json.load(infile)
+            names = set(PLAYER + (PIPE, 'base.png', 'background-day.png'))
+            if any(sprites.get(name, {}).get('sha1') != _digest(name) for name in names):
+                sprites = None
+        _sprites = sprites if sprites is not None else build()
+    return _sprites
+
+
+def sprite(name):
+    """the Sprite of an image in assets/sprites"""
+    entry = _load()[name]
+    mask = Mask(entry['width'], entry['height'], entry['rows']) if 'rows' in entry else None
+    return Sprite(entry['width'], entry['height'], mask)
+
+
+def images():
+    """the sprites search uses, keyed and ordered as node_util.IMAGES"""
+    pipe = sprite(PIPE)
+    return {
+        'base': sprite('base.png'),
+        'background': sprite('background-day.png'),
+        'player': tuple(sprite(name) for name in PLAYER),
+        'pipe': (pipe.rotated(), pipe),
+    }
+
+
+def hitmasks():
+    """the player and pipe hitmasks, as collision.load_hitmasks returns them"""
+    sprites = images()
+    return {
+        'pipe': tuple(pipe.mask for pipe in sprites['pipe']),
+        'player': tuple(player.mask for player in sprites['player']),
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'build':
+        print('{} sprites written to {}'.format(len(build()), SPRITES_FILE))
+    else:
+        print('usage: python assets.py build')
@@ -0,0 +1,173 @@
+"""Vectorized Flappy Bird: N independent games held in NumPy arrays.
+
+BatchFlappySim follows the frame order of sim.FlappySim (flap, crash test,
+score, move, spawn and despawn pipes), but every step advances all N games at
+once. Finished games are reset in the same step, so the caller can keep
+stepping without bookkeeping.
+"""
+import numpy as np
+
+from collision import pipe_table
+from physics import SCREENWIDTH, SCREENHEIGHT, PIPE_GAP_SIZE, BASE_Y, PLAYER_X, \
+    pipeVelX, playerFlapAcc, floor_y, move_batch
+import physics
+
+PIPE_SLOTS = 4   # at most three pipe pairs are ever on screen
+PLAYER_INDEX_CYCLE = np.array(physics.PLAYER_INDEX_CYCLE)
+
+
+class BatchFlappySim:
+    """step(actions) takes a length-N array of FALL/FLAP and returns
+    (observations, rewards, dones), where observations is an (N, 3) array of
+    (x_offset, y_offset, y_vel) rows. Where done is set, the observation
+    already belongs to the next game and final_scores holds the score of the
+    game that just ended."""
+
+    def __init__(self, n, hitmasks, seed=None, reward=1.0, penalty=-1000.0, gap_source=None):
+        """gap_source is a callable returning the gap ys of `size` new pipes,
+        random by default"""
+        self.n = n
+        self.rng = np.random.RandomState(seed)
+        self.gap_source = gap_source or self._random_gaps
+        self.reward = reward
+        self.penalty = penalty
+
+        # collision answers for every (player frame, pipe sprite, dx, dy)
+        table = pipe_table(hitmasks)
+        self.player_w, self.player_h = table.player_w, table.player_h
+        self.pipe_w, self.pipe_h = table.pipe_w, table.pipe_h
+        self.dx_min, self.dy_min = table.dx_min, table.dy_min
+        self.collisions = np.frombuffer(bytes(table.data), dtype=np.uint8).astype(bool).reshape(
+            table.frames, 2, table.dx_span, table.dy_span)
+
+        self.player_x = PLAYER_X
+        self.floor_y = floor_y(self.player_h)
+        self.gap_range = int(BASE_Y * 0.6 - PIPE_GAP_SIZE)
+        self.gap_base = int(BASE_Y * 0.2)
+
+        self.player_y = np.zeros(n, dtype=np.int64)
+        self.player_vel_y = np.zeros(n, dtype=np.int64)
+        self.player_index = np.zeros(n, dtype=np.int64)
+        self.frames = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.final_scores = np.zeros(n, dtype=np.int64)
+
+        # pipe ring buffers: pipe i of game g is slot (head[g] + i) % PIPE_SLOTS.
+        # gap_y is the top of the gap; upper pipe y is gap_y - pipe_h and lower
+        # pipe y is gap_y + PIPE_GAP_SIZE
+        self.pipe_x = np.zeros((n, PIPE_SLOTS), dtype=np.int64)
+        self.gap_y = np.zeros((n, PIPE_SLOTS), dtype=np.int64)
+        self.head = np.zeros(n, dtype=np.int64)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.rows = np.arange(n)
+        self.slots = np.arange(PIPE_SLOTS)[None, :]
+        self.reset()
+
+    def _random_gaps(self, size):
+        return self.rng.randint(0, self.gap_range, size) + self.gap_base
+
+    def reset(self, games=None):
+        """restarts the selected games (all by default); returns observations"""
+        if games is None:
+            games = self.rows
+        k = len(games)
+        self.player_y[games] = int((SCREENHEIGHT - self.player_h) / 2)
+        self.player_vel_y[games] = playerFlapAcc
+        self.player_index[games] = 0
+        self.frames[games] = 0
+        self.score[games] = 0
+
+        self.head[games] = 0
+        self.count[games] = 2
+        self.pipe_x[games, 0] = SCREENWIDTH + 200
+        self.pipe_x[games, 1] = SCREENWIDTH + 200 + SCREENWIDTH // 2
+        self.gap_y[games, 0] = self.gap_source(k)
+        self.gap_y[games, 1] = self.gap_source(k)
+        return self.observe()
+
+    def _slot(self, i):
+        return (self.head + i) % PIPE_SLOTS
+
+    def observe(self):
+        # head is slot 0's index already
+        first, second = self.head, self._slot(1)
+        focus = np.where(self.pipe_x[self.rows, first] - self.player_x > -30, first, second)
+        obs = np.empty((self.n, 3), dtype=np.int64)
+        obs[:, 0] = self.pipe_x[self.rows, focus] - (self.player_x + self.player_w)
+        obs[:, 1] = self.gap_y[self.rows, focus] + PIPE_GAP_SIZE // 2 - (self.player_y + self.player_h // 2)
+        obs[:, 2] = self.player_vel_y
+        return obs
+
+    def _active(self):
+        """(N, PIPE_SLOTS) mask of the slots holding on-screen pipes"""
+        age = (self.slots - self.head[:, None]) % PIPE_SLOTS
+        return age < self.count[:, None]
+
+    def check_crash(self, active=None):
+        """(N,) mask of games whose bird has crashed into the ground, the top
+        of the screen or a pipe; active is _active(), if already known"""
+        crashed = (self.player_y >= self.floor_y) | (self.player_y <= 0)
+        if active is None:
+            active = self._active()
+
+        # pipe offsets relative to the player, for both pipes of every slot
+        dx = self.pipe_x - self.player_x
+        dy_upper = self.gap_y - self.pipe_h - self.player_y[:, None]
+        dy_lower = self.gap_y + PIPE_GAP_SIZE - self.player_y[:, None]
+        x_overlap = active & (dx < self.player_w) & (dx > -self.pipe_w)
+
+        for which, dy in ((0, dy_upper), (1, dy_lower)):
+            game, slot = np.nonzero(x_overlap & (dy < self.player_h) & (dy > -self.pipe_h))
+            hits = self.collisions[self.player_index[game], which,
+                                   dx[game, slot] - self.dx_min - 1, dy[game, slot] - self.dy_min - 1]
+            crashed[game[hits]] = True
+        return crashed
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=bool)
+        flapped = actions & (self.player_y > -2 * self.player_h)
+        self.player_vel_y[flapped] = playerFlapAcc
+
+        # pipes only spawn and despawn after the score check
+        active = self._active()
+        dones = self.check_crash(active)
+        alive = ~dones
+        rewards = np.where(dones, self.penalty, self.reward)
+
+        # check for score
+        player_mid_pos = self.player_x + self.player_w // 2
+        pipe_mid_pos = self.pipe_x + self.pipe_w // 2
+        passed = active & (pipe_mid_pos <= player_mid_pos) & (player_mid_pos < pipe_mid_pos + 4)
+        self.score += passed.sum(axis=1) * alive
+
+        # player_index change, every third frame
+        self.frames += alive
+        animate = alive & (self.frames % 3 == 0)
+        self.player_index[animate] = PLAYER_INDEX_CYCLE[(self.frames[animate] // 3 - 1) % 4]
+
+        # player's movement; finished games are reset below anyway
+        self.player_y, self.player_vel_y = move_batch(self.player_y, self.player_vel_y, flapped, self.floor_y)
+
+        # move pipes to left
+        self.pipe_x += alive[:, None] * pipeVelX
+
+        # add new pipe when first pipe is about to touch left of screen
+        first_x = self.pipe_x[self.rows, self.head]
+        spawn = alive & (0 < first_x) & (first_x < 5)
+        if spawn.any():
+            games = self.rows[spawn]
+            slot = self._slot(self.count)[spawn]
+            self.pipe_x[games, slot] = SCREENWIDTH + 10
+            self.gap_y[games, slot] = self.gap_source(len(games))
+            self.count[spawn] += 1
+
+        # remove first pipe if its out of the screen
+        despawn = alive & (self.pipe_x[self.rows, self.head] < -self.pipe_w)
+        self.head[despawn] = (self.head[despawn] + 1) % PIPE_SLOTS
+        self.count[despawn] -= 1
+
+        if dones.any():
+            finished = self.rows[dones]
+            self.final_scores[finished] = self.score[finished]
+            self.reset(finished)
+        return self.observe(), rewards, dones
@@ -0,0 +1,919 @@
+"""Throughput benchmarks. Run `python benchmarks.py <name> [args]`, or with no
+arguments for the list of benchmarks.
+
+`python benchmarks.py suite` runs the named SCENARIOS with warmup and
+repetitions and writes mean, 95% confidence interval and rate per scenario
+to a JSON file; `python benchmarks.py compare old.json new.json` flags the
+regressions between two such files."""
+import os
+import random
+import shutil
+import sys
+import tempfile
+from itertools import cycle
+from time import time
+
+# rendered benchmarks open a window; let them run on display-less machines
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+
+class GapFollower:
+    """Scripted agent that flaps whenever it falls below the next gap, so games
+    last long enough to measure. Stops the benchmark after `frames` frames."""
+
+    def __init__(self, frames=None, seed=0):
+        self.frames = frames
+        self.rng = random.Random(seed)
+        self.episodes = 0
+        self.seen = 0
+
+    def take_action(self, game_state):
+        self.seen += 1
+        if self.frames is not None and self.seen > self.frames:
+            raise _BudgetSpent()
+        return game_state[1] < -8 and self.rng.random() < 0.8
+
+    def learn_from_episode(self):
+        self.episodes += 1
+
+
+class _BudgetSpent(Exception):
+    pass
+
+
+def bench_simulation(frames=20000):
+    """frames per second of FlappySim versus the rendered main_game loop"""
+    import flappy
+    from collision import load_hitmasks
+    from sim import FlappySim
+
+    random.seed(0)
+    sim = FlappySim(load_hitmasks())
+    agent = GapFollower()
+    game_state = sim.reset()
+    start = time()
+    for _ in range(frames):
+        game_state, _, done = sim.step(agent.take_action(game_state))
+        if done:
+            game_state = sim.reset()
+    headless = frames / (time() - start)
+    print('headless:          {:10.0f} frames/s'.format(headless))
+
+    flappy.load_assets()
+    rendered_frames = frames // 20
+    for fps, label in ((flappy.FPS, 'rendered (capped):'), (0, 'rendered:')):
+        flappy.FPS = fps
+        random.seed(0)
+        agent = GapFollower(rendered_frames if fps == 0 else min(rendered_frames, 2 * fps))
+        start = time()
+        try:
+            while True:
+                movement_info = {'player_y': 244, 'base_x': 0, 'player_index_gen': cycle([0, 1, 2, 1])}
+                flappy.main_game(movement_info, agent=agent)
+        except _BudgetSpent:
+            pass
+        rendered = (agent.seen - 1) / (time() - start)
+        print('{:18} {:10.0f} frames/s ({:.0f}x)'.format(label, rendered, headless / rendered))
+
+
+def bench_batch(n=4096, steps=500):
+    """transitions per second of BatchFlappySim against FlappySim"""
+    import numpy as np
+    from batch_sim import BatchFlappySim
+    from collision import load_hitmasks
+    from sim import FlappySim
+
+    hitmasks = load_hitmasks()
+    random.seed(0)
+    sim = FlappySim(hitmasks)
+    agent = GapFollower()
+    game_state = sim.reset()
+    frames = n * steps // 100
+    start = time()
+    for _ in range(frames):
+        game_state, _, done = sim.step(agent.take_action(game_state))
+        if done:
+            game_state = sim.reset()
+    single = frames / (time() - start)
+    print('FlappySim:             {:12.0f} transitions/s'.format(single))
+
+    rng = np.random.RandomState(0)
+    for size in sorted(set([1, 64, 1024, n])):
+        batch = BatchFlappySim(size, hitmasks, seed=0)
+        obs = batch.observe()
+        start = time()
+        episodes = 0
+        for _ in range(steps):
+            obs, _, dones = batch.step((obs[:, 1] < -8) & (rng.random_sample(size) < 0.8))
+            episodes += dones.sum()
+        rate = size * steps / (time() - start)
+        print('BatchFlappySim({:5}): {:12.0f} transitions/s ({:.1f}x), {} episodes'.format(
+            size, rate, rate / single, episodes))
+
+
+def bench_collision(checks=20000):
+    """player/pipe collision checks per second, bitmask versus per-pixel"""
+    from collision import load_hitmasks, overlap, overlap_any, pipe_table, pixel_collision
+
+    hitmasks = load_hitmasks()
+    player, pipe = hitmasks['player'][1], hitmasks['pipe'][1]
+    player_columns, pipe_columns = player.columns(), pipe.columns()
+    rng = random.Random(0)
+    # player rects that graze the top of the pipe rect, where the pixel test
+    # has to scan transparent corners before it can answer
+    cases = [(rng.randrange(-player.width + 1, pipe.width), rng.randrange(-player.height + 1, 4))
+             for _ in range(checks)]
+
+    start = time()
+    expected = [pixel_collision((x, y, player.width, player.height), (0, 0, pipe.width, pipe.height),
+                                player_columns, pipe_columns) for x, y in cases]
+    per_pixel = checks / (time() - start)
+    print('pixel_collision: {:10.0f} checks/s'.format(per_pixel))
+
+    start = time()
+    found = [overlap(player, x, y, pipe, 0, 0) for x, y in cases]
+    bitmask = checks / (time() - start)
+    assert found == expected
+    print('overlap:         {:10.0f} checks/s ({:.1f}x)'.format(bitmask, bitmask / per_pixel))
+
+    table = pipe_table(hitmasks)
+    start = time()
+    found = [table.collides(1, 1, -x, -y) for x, y in cases]
+    lookup = checks / (time() - start)
+    assert found == expected
+    print('table lookup:    {:10.0f} checks/s ({:.1f}x)'.format(lookup, lookup / per_pixel))
+
+    # one player against three on-screen pipe pairs, as in check_crash
+    upper = hitmasks['pipe'][0]
+    placed, upper_pipes, lower_pipes = [], [], []
+    for pipe_x in (-20, 124, 268):
+        placed.append((upper, pipe_x, 150 - upper.height))
+        placed.append((pipe, pipe_x, 250))
+        upper_pipes.append({'x': pipe_x, 'y': 150 - upper.height})
+        lower_pipes.append({'x': pipe_x, 'y': 250})
+    start = time()
+    for x, y in cases:
+        overlap_any(player, x, y + 250, placed)
+    print('overlap_any:     {:10.0f} frames/s (3 pipe pairs each)'.format(checks / (time() - start)))
+    start = time()
+    for x, y in cases:
+        table.collides_pipes(1, x, y + 250, upper_pipes, lower_pipes)
+    print('collides_pipes:  {:10.0f} frames/s (3 pipe pairs each)'.format(checks / (time() - start)))
+
+
+def bench_physics(frames=100000, n=1024):
+    """bird steps per second: move() then crashed(), the compiled step
+    function that search and FlappySim use, and move_batch()"""
+    import numpy as np
+    from collision import load_hitmasks, pipe_table
+    import physics
+
+    table = pipe_table(load_hitmasks())
+    step, floor_y = physics.step_function(table), physics.floor_y(table.player_h)
+    rng = random.Random(0)
+    upper_pipes = [{'x': x, 'y': -170} for x in (-20, 124, 268)]
+    lower_pipes = [{'x': x, 'y': 250} for x in (-20, 124, 268)]
+    cases = [(rng.randrange(100, 300), rng.randrange(-9, 11), rng.random() < 0.1, rng.randrange(3))
+             for _ in range(frames)]
+
+    start = time()
+    for y, vel_y, flap, index in cases:
+        y, vel_y = physics.move(y, vel_y, flap, floor_y)
+        physics.crashed(table, y, index, upper_pipes, lower_pipes)
+    reference = frames / (time() - start)
+    print('move + crashed: {:12.0f} steps/s'.format(reference))
+
+    start = time()
+    for y, vel_y, flap, index in cases:
+        step(y, vel_y, flap, index, upper_pipes, lower_pipes)
+    compiled = frames / (time() - start)
+    print('step_function:  {:12.0f} steps/s ({:.1f}x)'.format(compiled, compiled / reference))
+
+    y, vel_y = np.full(n, 200), np.zeros(n, dtype=np.int64)
+    flaps = np.random.RandomState(0).random_sample((frames // n, n)) < 0.1
+    start = time()
+    for flap in flaps:
+        physics.move_batch(y, vel_y, flap, floor_y)
+    batch = flaps.size / (time() - start)
+    print('move_batch({}): {:10.0f} moves/s ({:.1f}x, no crash test)'.format(n, batch, batch / reference))
+
+
+def bench_search(largest=450, step=20):
+    """A* over analysis.py's sweep: seconds, expansions and path length"""
+    import algs
+    import node_util
+    import structs
+
+    node_util.initialize()
+    total = 0.0
+    for size in range(20, largest + 1, step):
+        start = time()
+        path, expanded = algs.search(structs.PriorityQueue, size, lambda successor: algs.heuristic(successor))
+        elapsed = time() - start
+        total += elapsed
+        print('{:4} pipes: {:8.3f}s {:8} expanded {:8} frames'.format(size, elapsed, expanded, len(path)))
+    print('total:      {:8.3f}s'.format(total))
+
+
+def bench_successors(size=100, repeats=5):
+    """node_util.getSuccessors calls per second along an A* solution"""
+    import algs
+    import node_util
+    import structs
+
+    node_util.initialize()
+    path = algs.search(structs.PriorityQueue, size, lambda successor: algs.heuristic(successor))[0]
+    states = [node_util.getStart().state]
+    for flapped in path:
+        states.append([node.state for node in node_util.getSuccessors(states[-1])
+                       if node.flapped == flapped][0])
+
+    start = time()
+    for _ in range(repeats):
+        for state in states:
+            node_util.getSuccessors(state)
+    print('getSuccessors: {:10.0f} calls/s'.format(repeats * len(states) / (time() - start)))
+
+
+def bench_memory(size=450):
+    """peak memory of one A* search (run in a fresh process)"""
+    import resource
+    import algs
+    import node_util
+    import structs
+
+    node_util.initialize()
+    try:
+        import tracemalloc
+        tracemalloc.start()
+    except ImportError:
+        tracemalloc = None
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time()
+    path, expanded = algs.search(structs.PriorityQueue, size, lambda successor: algs.heuristic(successor))
+    elapsed = time() - start
+    # ru_maxrss is in kilobytes on Linux
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    print('{} pipes: {:.2f}s, {} expanded, {} frames'.format(size, elapsed, expanded, len(path)))
+    print('peak RSS growth:   {:8.1f} MB'.format(rss_growth / 1024.0))
+    if tracemalloc:
+        print('tracemalloc peak:  {:8.1f} MB'.format(tracemalloc.get_traced_memory()[1] / 1048576.0))
+
+
+def bench_fringe(largest=450, step=20, items=20000):
+    """fringe size and pops over the sweep; decrease-key versus linear update"""
+    import heapq
+    import algs
+    import node_util
+    import structs
+
+    class CountingQueue(structs.PriorityQueue):
+        def __init__(self):
+            structs.PriorityQueue.__init__(self)
+            self.largest = self.pops = 0
+            CountingQueue.last = self
+
+        def push(self, item, priority):
+            handle = structs.PriorityQueue.push(self, item, priority)
+            self.largest = max(self.largest, len(self))
+            return handle
+
+        def pop(self):
+            self.pops += 1
+            return structs.PriorityQueue.pop(self)
+
+    node_util.initialize()
+    for size in range(20, largest + 1, step):
+        start = time()
+        algs.search(CountingQueue, size, lambda successor: algs.heuristic(successor))
+        fringe = CountingQueue.last
+        print('{:4} pipes: {:8.3f}s {:8} pops {:8} largest fringe {:8} left'.format(
+            size, time() - start, fringe.pops, fringe.largest, len(fringe)))
+
+    # decrease-key on a large queue, against the previous scan-and-heapify
+    rng = random.Random(0)
+    priorities = [rng.random() for _ in range(items)]
+    lowered = [(rng.randrange(items), rng.random() / 2) for _ in range(items // 20)]
+
+    queue = structs.PriorityQueue()
+    for item, priority in enumerate(priorities):
+        queue.push(item, priority)
+    start = time()
+    for item, priority in lowered:
+        queue.update(item, priority)
+    indexed = len(lowered) / (time() - start)
+
+    heap = [(priority, item, item) for item, priority in enumerate(priorities)]
+    heapq.heapify(heap)
+    start = time()
+    for item, priority in lowered:
+        for index, (p, c, i) in enumerate(heap):
+            if i == item:
+                if p > priority:
+                    del heap[index]
+                    heap.append((priority, c, item))
+                    heapq.heapify(heap)
+                break
+    linear = len(lowered) / (time() - start)
+    print('update on {} items: {:.0f}/s indexed, {:.0f}/s linear ({:.0f}x)'.format(
+        items, indexed, linear, indexed / linear))
+
+
+def bench_bfs(largest=1):
+    """BFS with structs.Queue versus the old list-backed queue"""
+    import algs
+    import node_util
+    import structs
+
+    class ListQueue:
+        """the previous Queue: O(n) insert at the front of a list, and no
+        push_many, so the search pushes one successor at a time"""
+        def __init__(self):
+            self.list = []
+
+        def push(self, item):
+            self.list.insert(0, item)
+
+        def pop(self):
+            return self.list.pop()
+
+        def isEmpty(self):
+            return len(self.list) == 0
+
+    node_util.initialize()
+    for size in range(1, largest + 1):
+        for queue in (structs.Queue, ListQueue):
+            start = time()
+            path, expanded = algs.search(queue, size)
+            print('{:2} pipes {:10}: {:8.3f}s {:8} expanded {:5} frames'.format(
+                size, queue.__name__, time() - start, expanded, len(path)))
+
+
+def bench_macro(k=10, largest=450, step=80):
+    """A* with k-frame macro-actions versus per-frame expansion"""
+    import algs
+    import node_util
+    import structs
+
+    node_util.initialize()
+    for size in range(20, largest + 1, step):
+        for macro in (None, k):
+            start = time()
+            path, expanded = algs.search(structs.PriorityQueue, size,
+                                         lambda successor: algs.heuristic(successor), macro=macro)
+            print('{:4} pipes, {:9}: {:8.3f}s {:8} expanded {:8} frames'.format(
+                size, 'macro={}'.format(macro) if macro else 'per-frame', time() - start, expanded, len(path)))
+
+
+def bench_segments(largest=450, step=20):
+    """pipe-by-pipe search over analysis.py's sweep, from an empty segment
+    cache: seconds and cache hit rate, then the largest size again warm"""
+    import node_util
+    import segments
+
+    node_util.initialize()
+    directory = tempfile.mkdtemp()
+    try:
+        cache = segments.SegmentCache(os.path.join(directory, 'segments.json'))
+        sizes = list(range(20, largest + 1, step)) + [largest]
+        for size in sizes:
+            cache.hits = cache.misses = cache.fallbacks = 0
+            start = time()
+            path, _ = segments.solve(size, cache)
+            print('{:4} pipes: {:8.3f}s {:8} frames, hit rate {:6.1%} ({} fallbacks)'.format(
+                size, time() - start, len(path), cache.hit_rate(), cache.fallbacks))
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_engines(largest=450, step=215, seconds=10):
+    """A* against weighted A*, beam search and anytime search: seconds and
+    expansions per pipe"""
+    import algs
+    import node_util
+    import structs
+
+    node_util.initialize()
+    engines = [
+        ('A*', lambda size: algs.search(structs.PriorityQueue, size, lambda successor: algs.heuristic(successor))),
+        ('wA* e=1', lambda size: algs.weighted_astar(size, 1.0)),
+        ('wA* e=2', lambda size: algs.weighted_astar(size, 2.0)),
+        ('wA* e=5', lambda size: algs.weighted_astar(size, 5.0)),
+        ('beam w=10', lambda size: algs.beam_search(size, 10)),
+        ('beam w=20', lambda size: algs.beam_search(size, 20)),
+    ]
+    for size in range(20, largest + 1, step):
+        for name, engine in engines:
+            start = time()
+            found = engine(size)
+            elapsed = time() - start
+            if found is None:
+                print('{:4} pipes, {:9}: {:8.3f}s no solution'.format(size, name, elapsed))
+                continue
+            print('{:4} pipes, {:9}: {:8.4f}s/pipe {:8.1f} expanded/pipe'.format(
+                size, name, elapsed / size, float(found[1]) / size))
+
+    start = time()
+    for path, expanded, margin in algs.anytime_search(largest, seconds):
+        print('anytime {} pipes: margin {:2} after {:6.2f}s ({} expanded)'.format(
+            largest, margin, time() - start, expanded))
+
+
+def bench_qtable(updates=200000):
+    """QLearner._update calls per second, array Q-table versus the old dict"""
+    from collections import defaultdict
+    from q_learner import QLearner
+    from q_table import QTable
+
+    class DictQLearner(QLearner):
+        """the previous table: a defaultdict keyed by str((state, action))"""
+        def _get_q_value(self, state, action):
+            return self.q_values[str((state, action))]
+
+        def _set_q_value(self, state, action, q_):
+            self.q_values[str((state, action))] = q_
+
+        def _get_value(self, state):
+            return max([self._get_q_value(state, action) for action in self.actions]) if state else self.penalty
+
+    rng = random.Random(0)
+    states = QTable().states
+    samples = [(rng.choice(states), rng.randrange(2), rng.choice(states)) for _ in range(updates)]
+
+    results = {}
+    for name in ('dict', 'array'):
+        if name == 'dict':
+            learner = DictQLearner()
+            learner.q_values = defaultdict(float)
+            batch = samples
+        else:
+            learner = QLearner()
+            encode = learner.q_values.encode
+            batch = [(encode(s), a, encode(s_)) for s, a, s_ in samples]
+        start = time()
+        for s, a, s_ in batch:
+            learner._update(s, a, s_, 1.0)
+        results[name] = updates / (time() - start)
+        print('{:6} {:10.0f} updates/s'.format(name, results[name]))
+    print('speedup {:.1f}x'.format(results['array'] / results['dict']))
+
+
+
+def bench_traces(episodes=20):
+    """QLearner updates per step, backward loop versus eligibility traces"""
+    from q_learner import QLearner
+    from collision import load_hitmasks
+    from sim import FlappySim, run_episode
+
+    # long episodes from the demo weights, replayed into every learner
+    player = QLearner(import_from='training/demo.json', training=False)
+    histories = []
+    sim = FlappySim(load_hitmasks(), rng=random.Random(0))
+    for _ in range(episodes):
+        run_episode(sim, player)
+        histories.append(player.history)
+        player.history = []
+    steps = sum(len(history) for history in histories)
+    print('{} episodes, {} steps'.format(episodes, steps))
+
+    runs = [{'ld': ld} for ld in (0, 1, 10, 100)] + \
+        [{'trace': trace, 'trace_decay': decay} for trace in ('accumulating', 'replacing') for decay in (0, 0.9, 1)]
+    for options in runs:
+        learner = QLearner(import_from='training/demo.json', **options)
+        learner.reporting_interval = learner.dump_interval = 10 ** 9
+        start = time()
+        for history in histories:
+            learner.history = list(history)
+            learner.learn_from_episode()
+        setting = 'decay {}'.format(learner.trace_decay) if learner.trace else 'ld {}'.format(learner.ld)
+        print('{:12} {:<10} {:8.2f} us/step'.format(learner.trace or 'backward', setting, 1e6 * (time() - start) / steps))
+
+
+def bench_replay(target=50, seeds=3, limit=5000):
+    """episodes to a first score of target, online update versus experience replay"""
+    from q_learner import QLearner
+    from replay_buffer import ReplayBuffer
+    from collision import load_hitmasks
+    from sim import FlappySim, run_episode
+
+    hitmasks = load_hitmasks()
+    print('{:12} {:>20} {:>10}'.format('', 'episodes per seed', 'seconds'))
+    for name in ('online', 'uniform', 'prioritized'):
+        needed, start = [], time()
+        for seed in range(1, seeds + 1):
+            random.seed(seed)
+            replay = None if name == 'online' else ReplayBuffer(prioritized=name == 'prioritized', seed=seed)
+            learner = QLearner(replay=replay)
+            learner.reporting_interval = learner.max_episodes = 10 ** 9
+            sim = FlappySim(hitmasks, rng=random.Random(seed))
+            episodes = 1
+            while run_episode(sim, learner) < target and episodes < limit:
+                episodes += 1
+            needed.append(episodes)
+        print('{:12} {:>20} {:10.1f}'.format(name, ' '.join(str(n) for n in needed), time() - start))
+
+
+def bench_metrics(rows=50000):
+    """episode records per second, appending to a CSV per episode versus MetricsSink"""
+    from metrics import MetricsSink, load
+
+    directory = tempfile.mkdtemp()
+    try:
+        start = time()
+        for episode in range(rows):
+            with open(os.path.join(directory, 'scores.csv'), 'a') as score_keeping:
+                score_keeping.write('{},{}\n'.format(episode, episode % 7))
+        print('csv append  {:10.0f} rows/s'.format(rows / (time() - start)))
+
+        sink = MetricsSink(os.path.join(directory, 'metrics'))
+        start = time()
+        for episode in range(rows):
+            sink.record(episode=episode, score=episode % 7, frames=100, epsilon=0.01, states=1000,
+                        updates_per_s=1e5)
+        sink.close()
+        print('MetricsSink {:10.0f} rows/s, {} rows read back'.format(
+            rows / (time() - start), len(load(sink.directory)['score'])))
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_profiling(size=100, episodes=300):
+    """cost of the profiling timers: A* and headless training with them off and on"""
+    import profiling
+    import algs
+    import node_util
+    import structs
+    from q_learner import QLearner
+    from collision import load_hitmasks
+    from sim import FlappySim, run_episode
+
+    node_util.initialize()
+    hitmasks = load_hitmasks()
+    originals = node_util.advance, QLearner.__dict__['learn_from_episode']
+
+    def search():
+        algs.search(structs.PriorityQueue, size, lambda successor: algs.heuristic(successor))
+
+    def train():
+        random.seed(0)
+        learner = QLearner()
+        learner.reporting_interval = None
+        sim = FlappySim(hitmasks, rng=random.Random(0))
+        for _ in range(episodes):
+            run_episode(sim, learner)
+
+    for state in ('off', 'on', 'off again'):
+        if state == 'on':
+            profiling.enable()
+        else:
+            profiling.disable()
+        for name, run in (('search', search), ('training', train)):
+            times = []
+            for _ in range(3):
+                start = time()
+                run()
+                times.append(time() - start)
+            print('{:10} {:9} {:8.3f}s (best of 3)'.format(state, name, min(times)))
+    assert (node_util.advance, QLearner.__dict__['learn_from_episode']) == originals
+    print(profiling.report())
+
+
+def bench_checkpoint(repeats=5):
+    """Q-table load time and training stall per checkpoint, JSON versus binary"""
+    import q_table
+
+    directory = tempfile.mkdtemp()
+    try:
+        table = q_table.load('training/demo.json')
+        json_path, binary_path = os.path.join(directory, 'q.json'), os.path.join(directory, 'q.qt')
+        q_table.save(table, binary_path)
+
+        def best(function):
+            times = []
+            for _ in range(repeats):
+                start = time()
+                function()
+                times.append(time() - start)
+            return 1000 * min(times)
+
+        print('{:12} {:>10} {:>10}'.format('', 'load ms', 'stall ms'))
+        print('{:12} {:10.2f} {:10.2f}'.format(
+            'json', best(lambda: q_table.load('training/demo.json')),
+            best(lambda: q_table.save(table, json_path))))
+        print('{:12} {:10.2f} {:10.2f}'.format(
+            'binary', best(lambda: q_table.load(binary_path).best(0)),
+            best(lambda: q_table.save(table, binary_path))))
+        writer = q_table.CheckpointWriter(binary_path)
+        print('{:12} {:>10} {:10.2f}'.format('background', '', best(lambda: writer.submit(table))))
+        writer.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+# The suite: named scenarios with fixed seeds. Each scenario is set up once;
+# its setup returns (run, unit), and run() does one repetition and returns
+# how many units of work it did.
+
+def _search_scenario(structure, size, frame=None):
+    import algs
+    import node_util
+    import structs
+
+    node_util.initialize()
+    fringe = getattr(structs, structure)
+    cost_function = (lambda successor: algs.heuristic(successor)) if structure == 'PriorityQueue' else None
+    goal = (lambda state: state.frame >= frame and not state.crashed) if frame else None
+
+    def run():
+        return algs.search(fringe, size, cost_function, goal=goal)[1]
+    return run, 'expanded'
+
+
+def _learning_scenario(episodes=200):
+    from q_learner import QLearner
+    from collision import load_hitmasks
+    from sim import FlappySim, run_episode
+
+    hitmasks = load_hitmasks()
+
+    def run():
+        random.seed(0)
+        learner = QLearner()
+        learner.reporting_interval = None
+        sim = FlappySim(hitmasks, rng=random.Random(0))
+        for _ in range(episodes):
+            run_episode(sim, learner)
+        return episodes
+    return run, 'episodes'
+
+
+def _simulation_scenario(frames=20000):
+    from collision import load_hitmasks
+    from sim import FlappySim
+
+    hitmasks = load_hitmasks()
+
+    def run():
+        random.seed(0)
+        sim = FlappySim(hitmasks, rng=random.Random(0))
+        agent = GapFollower()
+        game_state = sim.reset()
+        for _ in range(frames):
+            game_state, _, done = sim.step(agent.take_action(game_state))
+            if done:
+                game_state = sim.reset()
+        return frames
+    return run, 'frames'
+
+
+def _collision_scenario(checks=50000):
+    from collision import load_hitmasks, pipe_table
+
+    table = pipe_table(load_hitmasks())
+    rng = random.Random(0)
+    upper_pipes = [{'x': x, 'y': -170} for x in (-20, 124, 268)]
+    lower_pipes = [{'x': x, 'y': 250} for x in (-20, 124, 268)]
+    cases = [(rng.randrange(-60, 80), rng.randrange(100, 300), rng.randrange(3)) for _ in range(checks)]
+
+    def run():
+        collides_pipes = table.collides_pipes
+        for x, y, frame in cases:
+            collides_pipes(frame, x, y, upper_pipes, lower_pipes)
+        return checks
+    return run, 'checks'
+
+
+def _physics_scenario(frames=50000):
+    from collision import load_hitmasks, pipe_table
+    import physics
+
+    step = physics.step_function(pipe_table(load_hitmasks()))
+    rng = random.Random(0)
+    upper_pipes = [{'x': x, 'y': -170} for x in (-20, 124, 268)]
+    lower_pipes = [{'x': x, 'y': 250} for x in (-20, 124, 268)]
+    cases = [(rng.randrange(100, 300), rng.randrange(-9, 11), rng.random() < 0.1, rng.randrange(3))
+             for _ in range(frames)]
+
+    def run():
+        for y, vel_y, flap, index in cases:
+            step(y, vel_y, flap, index, upper_pipes, lower_pipes)
+        return frames
+    return run, 'steps'
+
+
+# The scenarios below time each consumer of the physics step through APIs
+# that predate physics.py, so a tree from before it runs them too, as for
+# BASELINE.
+
+def _advance_scenario(depth=60, width=200):
+    import node_util
+
+    node_util.initialize()
+    states, frontier = [], [node_util.getStart().state]
+    for _ in range(depth):
+        successors = set()
+        for state in frontier:
+            for flapped in (True, False):
+                successor = node_util.advance(state, flapped)
+                if successor is not None and not successor.crashed:
+                    successors.add(successor)
+        frontier = sorted(successors, key=lambda state: state.key)[:width]
+        states += frontier
+
+    def run():
+        advance = node_util.advance
+        for state in states:
+            advance(state, True)
+            advance(state, False)
+        return 2 * len(states)
+    return run, 'steps'
+
+
+def _batch_scenario(n=1024, steps=300):
+    import numpy as np
+    from collision import load_hitmasks
+    from batch_sim import BatchFlappySim
+
+    hitmasks = load_hitmasks()
+    actions = np.random.RandomState(0).random_sample((steps, n)) < 0.08
+
+    def run():
+        batch = BatchFlappySim(n, hitmasks, seed=0)
+        for flaps in actions:
+            batch.step(flaps)
+        return n * steps
+    return run, 'transitions'
+
+
+def _qtable_scenario(operation, extension):
+    import atexit
+    import q_table
+
+    directory = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, directory, True)
+    table = q_table.load('training/demo.json')
+    path = os.path.join(directory, 'table' + extension)
+    q_table.save(table, path)
+
+    def run():
+        if operation == 'load':
+            q_table.load(path).best(0)
+        else:
+            q_table.save(table, path)
+        return 1
+    return run, operation + 's'
+
+
+# the simulation, advance and batch scenarios at ede9a67, the tree before
+# physics.py, recorded on the machine its speedups were measured on:
+#   python benchmarks.py compare bench_baseline.json bench_results.json
+BASELINE = 'bench_baseline.json'
+
+SCENARIOS = [
+    ('astar-20', lambda: _search_scenario('PriorityQueue', 20)),
+    ('astar-100', lambda: _search_scenario('PriorityQueue', 100)),
+    ('astar-450', lambda: _search_scenario('PriorityQueue', 450)),
+    ('dfs-20', lambda: _search_scenario('Stack', 20)),
+    ('bfs-frame-30', lambda: _search_scenario('Queue', 1, frame=30)),
+    ('learning', _learning_scenario),
+    ('simulation', _simulation_scenario),
+    ('collision', _collision_scenario),
+    ('physics', _physics_scenario),
+    ('advance', _advance_scenario),
+    ('batch', _batch_scenario),
+    ('qtable-load-json', lambda: _qtable_scenario('load', '.json')),
+    ('qtable-load-binary', lambda: _qtable_scenario('load', '.qt')),
+    ('qtable-dump-json', lambda: _qtable_scenario('dump', '.json')),
+    ('qtable-dump-binary', lambda: _qtable_scenario('dump', '.qt')),
+]
+
+# two-sided 95% Student t quantiles by degrees of freedom; 1.96 beyond
+_T95 = [12.71, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086]
+
+
+def _summarize(seconds, work, unit):
+    n = len(seconds)
+    mean = sum(seconds) / n
+    stdev = (sum((s - mean) ** 2 for s in seconds) / (n - 1)) ** 0.5 if n > 1 else 0.0
+    t = _T95[n - 2] if 1 < n <= len(_T95) + 1 else 1.96
+    return {'seconds': seconds, 'mean': mean, 'stdev': stdev, 'ci95': t * stdev / n ** 0.5,
+            'work': work, 'unit': unit, 'rate': work / mean if mean else None}
+
+
+def run_suite(names=None, warmup=1, repetitions=5):
+    """runs the named scenarios, all by default, and returns the results
+    as a JSON-ready dict"""
+    import platform
+    import subprocess
+    import numpy
+
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                         stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    results = {'meta': {'python': platform.python_version(), 'numpy': numpy.__version__,
+                        'platform': platform.platform(), 'commit': commit, 'time': time(),
+                        'warmup': warmup, 'repetitions': repetitions},
+               'scenarios': {}}
+    for name, setup in SCENARIOS:
+        if names and name not in names:
+            continue
+        run, unit = setup()
+        for _ in range(warmup):
+            run()
+        seconds, work = [], None
+        for _ in range(repetitions):
+            start = time()
+            work = run()
+            seconds.append(time() - start)
+        summary = results['scenarios'][name] = _summarize(seconds, work, unit)
+        print('{:20} {:10.4f}s +- {:8.4f} {:14.1f} {}/s'.format(
+            name, summary['mean'], summary['ci95'], summary['rate'], unit))
+        sys.stdout.flush()
+    return results
+
+
+def compare(old, new, threshold=0.05):
+    """prints the change of every scenario in both result dicts and returns
+    the names of regressions: slower by more than threshold, with 95%
+    confidence intervals that do not overlap"""
+    regressions = []
+    print('{:20} {:>10} {:>10} {:>8}'.format('scenario', 'old s', 'new s', 'change'))
+    for name in sorted(set(old['scenarios']) & set(new['scenarios'])):
+        before, after = old['scenarios'][name], new['scenarios'][name]
+        change = after['mean'] / before['mean'] - 1
+        flag = ''
+        if change > threshold and after['mean'] - after['ci95'] > before['mean'] + before['ci95']:
+            regressions.append(name)
+            flag = 'REGRESSION'
+        elif change < -threshold and after['mean'] + after['ci95'] < before['mean'] - before['ci95']:
+            flag = 'faster'
+        print('{:20} {:10.4f} {:10.4f} {:+7.1%} {}'.format(name, before['mean'], after['mean'], change, flag))
+    return regressions
+
+
+BENCHMARKS = {
+    'batch': bench_batch,
+    'bfs': bench_bfs,
+    'checkpoint': bench_checkpoint,
+    'collision': bench_collision,
+    'engines': bench_engines,
+    'fringe': bench_fringe,
+    'macro': bench_macro,
+    'memory': bench_memory,
+    'physics': bench_physics,
+    'profiling': bench_profiling,
+    'metrics': bench_metrics,
+    'qtable': bench_qtable,
+    'replay': bench_replay,
+    'search': bench_search,
+    'segments': bench_segments,
+    'successors': bench_successors,
+    'traces': bench_traces,
+    'simulation': bench_simulation,
+}
+
+
+def _suite_main(argv):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(prog='benchmarks.py', description='Benchmark suite.')
+    commands = parser.add_subparsers(dest='command')
+    suite = commands.add_parser('suite', help='run scenarios and write their results as JSON')
+    suite.add_argument('scenarios', nargs='*', help='scenarios to run, all by default: ' +
+                       ', '.join(name for name, _ in SCENARIOS))
+    suite.add_argument('-o', '--out', default='bench_results.json', help='results file')
+    suite.add_argument('-w', '--warmup', type=int, default=1, help='unmeasured runs per scenario')
+    suite.add_argument('-r', '--repetitions', type=int, default=5, help='measured runs per scenario')
+    comparison = commands.add_parser('compare', help='flag regressions between two results files')
+    comparison.add_argument('old')
+    comparison.add_argument('new')
+    comparison.add_argument('-t', '--threshold', type=float, default=0.05, help='slowdown to flag, as a fraction')
+    args = parser.parse_args(argv)
+
+    if args.command == 'suite':
+        results = run_suite(args.scenarios, args.warmup, args.repetitions)
+        with open(args.out, 'w') as outfile:
+            json.dump(results, outfile, sort_keys=True, indent=2, separators=(',', ': '))
+    else:
+        with open(args.old) as old, open(args.new) as new:
+            regressions = compare(json.load(old), json.load(new), args.threshold)
+        if regressions:
+            print('regressions: ' + ', '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('suite', 'compare'):
+        _suite_main(sys.argv[1:])
+    elif len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        for name in sorted(BENCHMARKS):
+            print('{:12} {}'.format(name, BENCHMARKS[name].__doc__))
+        print('suite, compare: run `python benchmarks.py suite -h`')
+        sys.exit()
+    else:
+        BENCHMARKS[sys.argv[1]](*[int(arg) for arg in sys.argv[2:]])
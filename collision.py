@@ -0,0 +1,242 @@
+"""Bitmask collision detection.
+
+A Mask stores a sprite's alpha as one integer per row, bit x set where pixel
+(x, y) is opaque. Two masks overlap iff, on some shared row, one row shifted
+into the other's frame ANDs to non-zero, so a test costs at most one shift and
+AND per overlapping row instead of a Python loop per pixel.
+
+The masks of the sprites are pre-extracted into assets.SPRITES_FILE, so
+loading them never decodes an image.
+
+Pipes never rotate and the player has three frames, so whether the player
+hits a pipe only depends on (player frame, pipe sprite, dx, dy).
+PipeCollisionTable precomputes every such answer, cached in TABLE_CACHE, and
+turns a crash test into a few integer lookups per pipe.
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+ASSETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+TABLE_CACHE = os.path.join(ASSETS, '.pipe_collisions.bin')
+_tables = {}
+
+
+class Mask:
+
+    def __init__(self, width, height, rows):
+        self.width = width
+        self.height = height
+        self.rows = rows
+
+    def columns(self):
+        """list of columns of booleans, indexed [x][y] like the old hitmasks"""
+        return [[bool(row >> x & 1) for row in self.rows] for x in range(self.width)]
+
+    def as_array(self):
+        """(width, height) NumPy boolean array"""
+        import numpy as np
+        return np.array(self.columns(), dtype=bool)
+
+    def to_json(self):
+        return {'width': self.width, 'height': self.height, 'rows': self.rows}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['width'], data['height'], data['rows'])
+
+
+def mask_from_surface(image):
+    """returns a Mask using a pygame surface's alpha."""
+    rows = []
+    for y in range(image.get_height()):
+        row = 0
+        for x in range(image.get_width()):
+            if image.get_at((x, y))[3]:
+                row |= 1 << x
+        rows.append(row)
+    return Mask(image.get_width(), image.get_height(), rows)
+
+
+def load_hitmasks():
+    """returns the player and pipe hitmasks, from assets.SPRITES_FILE. No
+    display is needed."""
+    import assets
+    return assets.hitmasks()
+
+
+def overlap(mask1, x1, y1, mask2, x2, y2):
+    """returns True if mask1 placed at (x1, y1) and mask2 placed at (x2, y2)
+    share an opaque pixel."""
+    if x1 >= x2 + mask2.width or x2 >= x1 + mask1.width:
+        return False
+    top, bottom = max(y1, y2), min(y1 + mask1.height, y2 + mask2.height)
+    if top >= bottom:
+        return False
+
+    rows1, rows2 = mask1.rows, mask2.rows
+    shift = x1 - x2
+    if shift >= 0:
+        for y in range(top, bottom):
+            if (rows1[y - y1] << shift) & rows2[y - y2]:
+                return True
+    else:
+        shift = -shift
+        for y in range(top, bottom):
+            if (rows1[y - y1] >> shift) & rows2[y - y2]:
+                return True
+    return False
+
+
+def overlap_any(mask, x, y, placed):
+    """returns the index of the first (mask, x, y) in placed that overlaps
+    mask at (x, y), or -1. Use it to test the player against every on-screen
+    pipe in one call."""
+    width, height = mask.width, mask.height
+    for i, (other, ox, oy) in enumerate(placed):
+        # cheap rejection on the bounding rects before touching any rows
+        if ox < x + width and x < ox + other.width and oy < y + height and y < oy + other.height:
+            if overlap(mask, x, y, other, ox, oy):
+                return i
+    return -1
+
+
+def pixel_collision(rect1, rect2, hitmask1, hitmask2):
+    """Per-pixel reference for overlap(), as the game originally did it:
+    rects are (x, y, w, h) and hitmasks are indexed [x][y]."""
+    left, top = max(rect1[0], rect2[0]), max(rect1[1], rect2[1])
+    width = min(rect1[0] + rect1[2], rect2[0] + rect2[2]) - left
+    height = min(rect1[1] + rect1[3], rect2[1] + rect2[3]) - top
+
+    if width <= 0 or height <= 0:
+        return False
+
+    x1, y1 = left - rect1[0], top - rect1[1]
+    x2, y2 = left - rect2[0], top - rect2[1]
+
+    for x in range(width):
+        for y in range(height):
+            if hitmask1[x1 + x][y1 + y] and hitmask2[x2 + x][y2 + y]:
+                return True
+    return False
+
+
+class PipeCollisionTable:
+    """table[player frame, pipe sprite, dx, dy] is True when the player mask
+    overlaps the pipe mask placed dx, dy from it. Offsets outside the
+    stored range cannot overlap at all."""
+
+    def __init__(self, hitmasks, data=None):
+        self.player_w = hitmasks['player'][0].width
+        self.player_h = hitmasks['player'][0].height
+        self.pipe_w = hitmasks['pipe'][0].width
+        self.pipe_h = hitmasks['pipe'][0].height
+        self.frames = len(hitmasks['player'])
+
+        # valid offsets are min < d < max, as for overlapping rects
+        self.dx_min, self.dx_max = -self.pipe_w, self.player_w
+        self.dy_min, self.dy_max = -self.pipe_h, self.player_h
+        self.dx_span = self.dx_max - self.dx_min - 1
+        self.dy_span = self.dy_max - self.dy_min - 1
+        self.data = data if data is not None else self._build(hitmasks)
+
+    def index(self, frame, pipe, dx, dy):
+        return (((frame * 2 + pipe) * self.dx_span + dx - self.dx_min - 1) * self.dy_span
+                + dy - self.dy_min - 1)
+
+    def _build(self, hitmasks):
+        data = bytearray(self.frames * 2 * self.dx_span * self.dy_span)
+        i = 0
+        for player in hitmasks['player']:
+            for pipe in hitmasks['pipe']:
+                for dx in range(self.dx_min + 1, self.dx_max):
+                    for dy in range(self.dy_min + 1, self.dy_max):
+                        data[i] = overlap(player, 0, 0, pipe, dx, dy)
+                        i += 1
+        return data
+
+    def collides(self, frame, pipe, dx, dy):
+        """player frame `frame` against pipe sprite `pipe` (0 upper, 1 lower)"""
+        if self.dx_min < dx < self.dx_max and self.dy_min < dy < self.dy_max:
+            return bool(self.data[self.index(frame, pipe, dx, dy)])
+        return False
+
+    def collides_pipes(self, frame, x, y, upper_pipes, lower_pipes):
+        """returns True if the player at (x, y) hits any of the pipe dicts"""
+        data, dx_min, dx_max, dy_min, dy_max = self.data, self.dx_min, self.dx_max, self.dy_min, self.dy_max
+        dy_span = self.dy_span
+        for u_pipe, l_pipe in zip(upper_pipes, lower_pipes):
+            dx = u_pipe['x'] - x
+            if not dx_min < dx < dx_max:
+                continue
+            column = ((frame * 2) * self.dx_span + dx - dx_min - 1) * dy_span - dy_min - 1
+            dy = u_pipe['y'] - y
+            if dy_min < dy < dy_max and data[column + dy]:
+                return True
+            dy = l_pipe['y'] - y
+            if dy_min < dy < dy_max and data[column + self.dx_span * dy_span + dy]:
+                return True
+        return False
+
+    def verify(self, hitmasks):
+        """exhaustively compares the table with the per-pixel test, one pixel
+        beyond the stored range on every side. Returns the mismatches."""
+        mismatches = []
+        for frame, player in enumerate(hitmasks['player']):
+            player_columns = player.columns()
+            for pipe, pipe_mask in enumerate(hitmasks['pipe']):
+                pipe_columns = pipe_mask.columns()
+                for dx in range(self.dx_min - 1, self.dx_max + 2):
+                    for dy in range(self.dy_min - 1, self.dy_max + 2):
+                        expected = pixel_collision((0, 0, player.width, player.height),
+                                                   (dx, dy, pipe_mask.width, pipe_mask.height),
+                                                   player_columns, pipe_columns)
+                        if self.collides(frame, pipe, dx, dy) != expected:
+                            mismatches.append((frame, pipe, dx, dy))
+        return mismatches
+
+
+def masks_key(hitmasks):
+    """a digest of the player and pipe hitmasks, to tell whether data built
+    from them is still valid"""
+    digest = hashlib.sha1()
+    for mask in hitmasks['player'] + hitmasks['pipe']:
+        digest.update(json.dumps(mask.to_json(), sort_keys=True).encode('ascii'))
+    return digest.hexdigest().encode('ascii')
+
+
+def pipe_table(hitmasks):
+    """returns the PipeCollisionTable for hitmasks, loaded from TABLE_CACHE
+    when it was built from the same masks, else built and cached."""
+    key = masks_key(hitmasks)
+    if key in _tables:
+        return _tables[key]
+
+    table = None
+    if os.path.isfile(TABLE_CACHE):
+        with open(TABLE_CACHE, 'rb') as infile:
+            if infile.read(len(key)) == key:
+                table = PipeCollisionTable(hitmasks, bytearray(infile.read()))
+    if table is None:
+        table = PipeCollisionTable(hitmasks)
+        # a temporary file of its own, as several processes may build the
+        # table at once on a cold cache
+        fd, tmp = tempfile.mkstemp(dir=ASSETS, prefix='.pipe_collisions.')
+        with os.fdopen(fd, 'wb') as outfile:
+            outfile.write(key)
+            outfile.write(table.data)
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, TABLE_CACHE)
+
+    _tables[key] = table
+    return table
+
+
+if __name__ == '__main__':
+    if '--verify' in sys.argv:
+        hitmasks = load_hitmasks()
+        mismatches = pipe_table(hitmasks).verify(hitmasks)
+        print('{} mismatches {}'.format(len(mismatches), mismatches[:10]))
+        sys.exit(1 if mismatches else 0)
@@ -1,13 +0,0 @@
-PIPE_IND = 0
-SCORE_GOAL = 100
-FPS = 3000
-SCREENWIDTH = 288
-SCREENHEIGHT = 512
-playerMaxVelY = 10   # max vel along Y, max descend speed
-playerMinVelY = -8   # min vel along Y, max ascend speed
-pipeVelX = -4
-playerFlapAcc = -9   # players speed on flapping
-
-PIPE_GAP_SIZE = 100
-BASE_Y = SCREENHEIGHT * 0.79
-IMAGES, SOUNDS, HITMASKS = {}, {}, {}
\ No newline at end of file
@@ -7,21 +7,38 @@ from pygame.locals import *
 import node_util
 import algs
 import structs
+import segments
 import json
 import os
 from q_learner import QLearner
+from metrics import MetricsSink
+import q_parallel
+import q_table
+from planner import Planner
+from physics import SCREENWIDTH, SCREENHEIGHT, PIPE_GAP_SIZE, BASE_Y, PLAYER_INDEX_CYCLE, PLAYER_X
+from sim import FlappySim, run_episode
+from collision import load_hitmasks
 import argparse
+import profiling
 
-PIPE_IND = 0
 FPS = 60
-SCREENWIDTH = 288
-SCREENHEIGHT = 512
-PIPE_GAP_SIZE = 100
-BASE_Y = SCREENHEIGHT * 0.79
 IMAGES, SOUNDS, HITMASKS = {}, {}, {}
 
 
-def main(action_list=None, agent=None):
+def main(action_list=None, agent=None, planner=None, metrics=None):
+    load_assets()
+
+    while True:  # Game loop
+        movement_info = show_welcome_animation(action_list=action_list, agent=agent or planner)
+        crash_info = main_game(movement_info, action_list=action_list, agent=agent, planner=planner,
+                               metrics=metrics)
+        if agent and agent.finished:
+            return
+        show_game_over_screen(crash_info, agent=agent or planner)
+
+
+def load_assets():
+    """opens the window and loads sprites, sounds and hitmasks"""
     global SCREEN, FPSCLOCK
     pygame.init()
     FPSCLOCK = pygame.time.Clock()
@@ -75,32 +92,17 @@ def main(action_list=None, agent=None):
         pygame.image.load('assets/sprites/pipe-green.png').convert_alpha(),
     )
 
-    # hismask for pipes
-    HITMASKS['pipe'] = (
-        get_hitmask(IMAGES['pipe'][0]),
-        get_hitmask(IMAGES['pipe'][1]),
-    )
-
-    # hitmask for player
-    HITMASKS['player'] = (
-        get_hitmask(IMAGES['player'][0]),
-        get_hitmask(IMAGES['player'][1]),
-        get_hitmask(IMAGES['player'][2]),
-    )
-
-    while True:  # Game loop
-        movement_info = show_welcome_animation(action_list=action_list, agent=agent)
-        crash_info = main_game(movement_info, action_list=action_list, agent=agent)
-        show_game_over_screen(crash_info, agent=agent)
+    # hitmasks for pipes and player
+    HITMASKS.update(load_hitmasks())
 
 
 def show_welcome_animation(action_list=None, agent=None):
     player_index = 0
-    player_index_gen = cycle([0, 1, 2, 1])
+    player_index_gen = cycle(PLAYER_INDEX_CYCLE)
     # iterator used to change player_index after every 5th iteration
     loop_iter = 0
 
-    player_x = int(SCREENWIDTH * 0.2)
+    player_x = PLAYER_X
     player_y = int((SCREENHEIGHT - IMAGES['player'][0].get_height()) / 2)
 
     message_x = int((SCREENWIDTH - IMAGES['message'].get_width()) / 2)
@@ -151,145 +153,91 @@ def show_welcome_animation(action_list=None, agent=None):
 
         pygame.display.update()
         FPSCLOCK.tick(FPS)
+        # the replay starts where search planned it from, not on the shm
         return {
-            'player_y': player_y + player_shm_vals['val'],
+            'player_y': player_y,
             'base_x': base_x,
             'player_index_gen': player_index_gen,
         }
 
 
-def main_game(movement_info, action_list=None, agent=None):
-    score = player_index = loop_iter = 0
-    player_index_gen = movement_info['player_index_gen']
-    player_x, player_y = int(SCREENWIDTH * 0.2), movement_info['player_y']
+def main_game(movement_info, action_list=None, agent=None, planner=None, metrics=None):
+    """renders a FlappySim game, feeding it keyboard, replay, agent or
+    planner input; a learning agent's episodes are recorded to metrics"""
+    sim = FlappySim(HITMASKS, pipe_source=PIPES.source() if action_list else get_random_pipe)
+    game_state = sim.reset(player_y=movement_info['player_y'],
+                           player_index_gen=movement_info['player_index_gen'])
 
     base_x = movement_info['base_x']
     base_shift = IMAGES['base'].get_width() - IMAGES['background'].get_width()
-
-    # get 2 new pipes to add to upper_pipes lower_pipes list
-    new_pipe1 = get_pipe() if action_list else get_random_pipe()
-    new_pipe2 = get_pipe() if action_list else get_random_pipe()
-
-    upper_pipes = [
-        {'x': SCREENWIDTH + 200, 'y': new_pipe1[0]['y']},
-        {'x': SCREENWIDTH + 200 + (SCREENWIDTH / 2), 'y': new_pipe2[0]['y']},
-    ]
-
-    lower_pipes = [
-        {'x': SCREENWIDTH + 200, 'y': new_pipe1[1]['y']},
-        {'x': SCREENWIDTH + 200 + (SCREENWIDTH / 2), 'y': new_pipe2[1]['y']},
-    ]
-
-    pipe_vel_x = -4
-
-    # player velocity, max velocity, downward accleration, accleration on flap
-    player_vel_y = -9  # player's velocity along Y, default same as player_flapped
-    player_max_vel_y = 10  # max vel along Y, max descend speed
-    player_min_vel_y = -8  # min vel along Y, max ascend speed
-    player_acc_y = 1  # players downward accleration
-    player_flap_acc = -9  # players speed on flapping
-    player_flapped = False  # True when player flaps
     action_ind = 0
+    if planner:
+        planner.reset()
 
     while True:
-
-        focus = lower_pipes[0] if lower_pipes[0]['x'] - player_x > -30 else lower_pipes[1]
+        flap = False
 
         for event in pygame.event.get():
             if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
                 pygame.quit()
                 sys.exit()
             if event.type == KEYDOWN and (event.key == K_SPACE or event.key == K_UP):
-                if player_y > -2 * IMAGES['player'][0].get_height():
-                    player_vel_y = player_flap_acc
-                    player_flapped = True
+                flap = True
 
         if action_list:
             if action_ind < len(action_list) and action_list[action_ind]:
-                if player_y > -2 * IMAGES['player'][0].get_height():
-                    player_vel_y = player_flap_acc
-                    player_flapped = True
+                flap = True
             action_ind += 1
 
-        if agent:
-            game_state = (focus['x'] - (player_x + 34), focus['y'] - PIPE_GAP_SIZE / 2 - (player_y + 12), player_vel_y)
-            if agent.take_action(game_state):
-                if player_y > -2 * IMAGES['player'][0].get_height():
-                    player_vel_y = player_flap_acc
-                    player_flapped = True
+        if agent and agent.take_action(game_state):
+            flap = True
 
-        crashTest = check_crash({'x': player_x, 'y': player_y, 'index': player_index},
-                                upper_pipes, lower_pipes)
+        if planner and planner.take_action(sim):
+            flap = True
 
-        # TODO crash test should take into account that the bird can't fly off the screen... Logic needn't be out here.
-        if crashTest[0] or player_y <= 0:
+        game_state, _, done = sim.step(flap)
+
+        if done:
 
             if agent:
                 agent.learn_from_episode()
-                with open('scores7.csv', 'a') as score_keeping:
-                    score_keeping.write('{},{}\n'.format(agent.episodes, score))
+                if metrics:
+                    metrics.record_episode(agent, sim.score, sim.frames)
+
+            if planner:
+                print('score {}, decision latency (ms): {}'.format(sim.score, ', '.join(
+                    'p{} {:.3f}'.format(p, ms) for p, ms in sorted(planner.percentiles().items()))))
 
             return {
-                'y': player_y,
-                'groundCrash': crashTest[1],
+                'y': sim.player_y,
+                'groundCrash': sim.ground_crash,
                 'base_x': base_x,
-                'upper_pipes': upper_pipes,
-                'lower_pipes': lower_pipes,
-                'score': score,
-                'player_vel_y': player_vel_y,
+                'upper_pipes': sim.upper_pipes,
+                'lower_pipes': sim.lower_pipes,
+                'score': sim.score,
+                'player_vel_y': sim.player_vel_y,
             }
 
-        # check for score
-        player_mid_pos = player_x + IMAGES['player'][0].get_width() / 2
-        for pipe in upper_pipes:
-            pipe_mid_pos = pipe['x'] + IMAGES['pipe'][0].get_width() / 2
-            if pipe_mid_pos <= player_mid_pos < pipe_mid_pos + 4:
-                score += 1
-
-        # player_index base_x change
-        if (loop_iter + 1) % 3 == 0:
-            player_index = player_index_gen.next()
-        loop_iter = (loop_iter + 1) % 30
         base_x = -((-base_x + 100) % base_shift)
 
-        # player's movement
-        if player_vel_y < player_max_vel_y and not player_flapped:
-            player_vel_y += player_acc_y
-        if player_flapped:
-            player_flapped = False
-        player_height = IMAGES['player'][player_index].get_height()
-        player_y += min(player_vel_y, BASE_Y - player_y - player_height)
+        draw_frame(sim, base_x)
+        FPSCLOCK.tick(FPS)
 
-        # move pipes to left
-        for uPipe, lPipe in zip(upper_pipes, lower_pipes):
-            uPipe['x'] += pipe_vel_x
-            lPipe['x'] += pipe_vel_x
 
-        # add new pipe when first pipe is about to touch left of screen
-        if 0 < upper_pipes[0]['x'] < 5:
-            new_pipe = get_pipe() if action_list else get_random_pipe()
-            upper_pipes.append(new_pipe[0])
-            lower_pipes.append(new_pipe[1])
+def draw_frame(sim, base_x):
+    """draws the sprites of a frame of sim and updates the display"""
+    SCREEN.blit(IMAGES['background'], (0, 0))
 
-        # remove first pipe if its out of the screen
-        if upper_pipes[0]['x'] < -IMAGES['pipe'][0].get_width():
-            upper_pipes.pop(0)
-            lower_pipes.pop(0)
+    for uPipe, lPipe in zip(sim.upper_pipes, sim.lower_pipes):
+        SCREEN.blit(IMAGES['pipe'][0], (uPipe['x'], uPipe['y']))
+        SCREEN.blit(IMAGES['pipe'][1], (lPipe['x'], lPipe['y']))
 
-        # draw sprites
-        SCREEN.blit(IMAGES['background'], (0, 0))
+    SCREEN.blit(IMAGES['base'], (base_x, BASE_Y))
+    # print score so player overlaps the score
+    show_score(sim.score)
+    SCREEN.blit(IMAGES['player'][sim.player_index], (sim.player_x, sim.player_y))
 
-        for uPipe, lPipe in zip(upper_pipes, lower_pipes):
-            SCREEN.blit(IMAGES['pipe'][0], (uPipe['x'], uPipe['y']))
-            SCREEN.blit(IMAGES['pipe'][1], (lPipe['x'], lPipe['y']))
-
-        SCREEN.blit(IMAGES['base'], (base_x, BASE_Y))
-        # print score so player overlaps the score
-        show_score(score)
-        SCREEN.blit(IMAGES['player'][player_index], (player_x, player_y))
-
-        pygame.display.update()
-        FPSCLOCK.tick(FPS)
+    pygame.display.update()
 
 
 def show_game_over_screen(crash_info, agent=None):
@@ -366,14 +314,6 @@ def get_random_pipe():
     ]
 
 
-def get_pipe():
-    global PIPE_IND
-    """returns the next pipe from the master list"""
-    p = PIPES[PIPE_IND]
-    PIPE_IND += 1
-    return p
-
-
 def show_score(score):
     """displays score in center of screen"""
     score_digits = [int(x) for x in list(str(score))]
@@ -389,63 +329,12 @@ def show_score(score):
         x_offset += IMAGES['numbers'][digit].get_width()
 
 
-def check_crash(player, upper_pipes, lower_pipes):
-    pi = player['index']
-    player['w'] = IMAGES['player'][0].get_width()
-    player['h'] = IMAGES['player'][0].get_height()
-
-    # if player crashes into ground
-    if player['y'] + player['h'] >= BASE_Y - 1:
-        return [True, True]
-    else:
-
-        player_rect = pygame.Rect(player['x'], player['y'],
-                                  player['w'], player['h'])
-        pipe_w = IMAGES['pipe'][0].get_width()
-        pipe_h = IMAGES['pipe'][0].get_height()
-
-        for uPipe, lPipe in zip(upper_pipes, lower_pipes):
-            u_pipe_rect = pygame.Rect(uPipe['x'], uPipe['y'], pipe_w, pipe_h)
-            l_pipe_rect = pygame.Rect(lPipe['x'], lPipe['y'], pipe_w, pipe_h)
-
-            p_hitmask = HITMASKS['player'][pi]
-            u_hitmask = HITMASKS['pipe'][0]
-            l_hitmask = HITMASKS['pipe'][1]
-
-            u_collide = pixel_collision(player_rect, u_pipe_rect, p_hitmask, u_hitmask)
-            l_collide = pixel_collision(player_rect, l_pipe_rect, p_hitmask, l_hitmask)
-
-            if u_collide or l_collide:
-                return [True, False]
-
-    return [False, False]
-
-
-def pixel_collision(rect1, rect2, hitmask1, hitmask2):
-    """Checks if two objects collide and not just their rects"""
-    rect = rect1.clip(rect2)
-
-    if rect.width == 0 or rect.height == 0:
-        return False
-
-    x1, y1 = rect.x - rect1.x, rect.y - rect1.y
-    x2, y2 = rect.x - rect2.x, rect.y - rect2.y
-
-    for x in xrange(rect.width):
-        for y in xrange(rect.height):
-            if hitmask1[x1 + x][y1 + y] and hitmask2[x2 + x][y2 + y]:
-                return True
-    return False
-
-
-def get_hitmask(image):
-    """returns a hitmask using an image's alpha."""
-    mask = []
-    for x in range(image.get_width()):
-        mask.append([])
-        for y in range(image.get_height()):
-            mask[x].append(bool(image.get_at((x, y))[3]))
-    return mask
+def train_headless(agent, metrics):
+    """runs training episodes through FlappySim, without a window or clock"""
+    sim = FlappySim(load_hitmasks())
+    while not agent.finished:
+        score = run_episode(sim, agent)
+        metrics.record_episode(agent, score, sim.frames)
 
 
 if __name__ == '__main__':
@@ -454,22 +343,33 @@ if __name__ == '__main__':
     parser.add_argument('-d', '--demo', help='See a demo of the TD-learner', action='store_true')
     parser.add_argument('-s', '--search', help='Solve with A*, then watch.', action='store_true')
     parser.add_argument('-l', '--learn', help='Solve with TD-lambda, then watch.', action='store_true')
+    parser.add_argument('-p', '--plan', help='Play random pipes with the receding-horizon planner.', action='store_true')
     parser.add_argument('-w', '--weights', help='Upload previous solution', action='store_true')
+    parser.add_argument('-m', '--macro', type=int, help='Search with macro-actions of up to MACRO frames.')
+    parser.add_argument('--segmented', help='Search pipe by pipe, reusing cached segments.', action='store_true')
+    parser.add_argument('--headless', help='Train the TD-learner without rendering.', action='store_true')
+    parser.add_argument('--workers', type=int, help='Train headless across WORKERS processes sharing one Q-table.')
+    parser.add_argument('--timers', help='Time the hot paths and print a summary at exit.', action='store_true')
+    parser.add_argument('--profile', metavar='PATH', help='Run under cProfile and write its stats to PATH at exit.')
     parser.add_argument('size', type=int, nargs='?', help='size of the search problem to solve. Ignored if agent is in RL mode.')
     args = vars(parser.parse_args())
 
+    if args['timers'] or args['profile']:
+        profiling.hook(__name__, 'draw_frame', 'render')
+        profiling.start(args['profile'], timed=args['timers'])
+
     if args['search']:
-        if args['size'] > 450:
-            print "please choose a number under 450; deterministic pipes are only defined up to 450."
-            sys.exit()
         action_list = None
         node_util.initialize()
         if args['weights']:
             if os.path.isfile('path.json'):
                 infile = open('path.json')
                 action_list = json.load(infile)
+        elif args['segmented']:
+            action_list = segments.solve(args['size'])[0]
         else:
-            action_list = algs.search(structs.PriorityQueue, args['size'], lambda successor: algs.heuristic(successor))[0]
+            action_list = algs.search(structs.PriorityQueue, args['size'], lambda successor: algs.heuristic(successor),
+                                      macro=args['macro'])[0]
             outfile = open('path.json', 'w')
             dump = json.dumps(action_list, sort_keys=True, indent=2, separators=(',', ': '))
             outfile.write(dump)
@@ -481,7 +381,21 @@ if __name__ == '__main__':
         if args['weights']:
             path = 'training/demo.json'
 
-        main(agent=QLearner(import_from=path, export_to='training/weights.json', epsilon=None, ld=1, training=True))
+        agent = QLearner(import_from=path, export_to='training/weights.qt', epsilon=None, ld=1, training=True)
+        # the metrics sink reports progress in place of the learner
+        metrics = MetricsSink(report_every=agent.reporting_interval)
+        agent.reporting_interval = None
+        if args['workers']:
+            table, run = q_parallel.train(args['workers'], agent.max_episodes, agent.q_values, metrics=metrics)
+            q_table.save(table, agent.export_to, len(run['scores']))
+        elif args['headless']:
+            train_headless(agent, metrics)
+        else:
+            main(agent=agent, metrics=metrics)
+        metrics.close()
+
+    elif args['plan']:
+        main(planner=Planner(load_hitmasks()))
 
     elif args['demo']:
         main(agent=QLearner(import_from='training/demo.json', training=False))
@@ -0,0 +1,176 @@
+"""Buffered, columnar training metrics.
+
+MetricsSink collects one row of COLUMNS per episode in memory and a
+background thread appends them to disk every `flush_every` rows or
+`flush_seconds` seconds, whichever comes first. Storage is columnar: one
+file of little-endian float64 per column in a directory, so a column
+loads with a single numpy.fromfile, and appending never rewrites
+anything. A flush cut short can leave some columns longer than others;
+a new MetricsSink cuts them all back to the rows every column holds before
+it appends, so rows stay aligned. load() reads the columns back; rolling_mean() smooths them for
+plots such as those in FB Stats.xlsx.
+
+RollingStats keeps the last `window` rows in memory, so training can
+report recent means without reading anything back.
+
+    python metrics.py csv [directory]
+
+prints the columns as CSV, for spreadsheets.
+"""
+import atexit
+from collections import deque
+import os
+import sys
+import threading
+from time import time
+
+import numpy as np
+
+METRICS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'training', 'metrics')
+
+COLUMNS = ('episode', 'score', 'frames', 'epsilon', 'states', 'wall_time', 'updates_per_s')
+
+
+class RollingStats:
+    """statistics of the last `window` rows of every column"""
+
+    def __init__(self, window=100, columns=COLUMNS):
+        self.columns = dict((column, i) for i, column in enumerate(columns))
+        self.rows = deque(maxlen=window)   # tuples in the order of columns
+
+    def add(self, row):
+        self.rows.append(row)
+
+    def values(self, column):
+        i = self.columns[column]
+        return np.array([row[i] for row in self.rows], dtype=float)
+
+    def mean(self, column):
+        values = self.values(column)
+        return float(values.mean()) if len(values) else float('nan')
+
+    def max(self, column):
+        values = self.values(column)
+        return float(values.max()) if len(values) else float('nan')
+
+    def std(self, column):
+        values = self.values(column)
+        return float(values.std()) if len(values) else float('nan')
+
+
+class MetricsSink:
+
+    def __init__(self, directory=METRICS_DIR, flush_every=1000, flush_seconds=5.0, window=100, report_every=None):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        _align(directory)
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.report_every = report_every   # rows between status lines, or None
+        self.rolling = RollingStats(window)
+        self.start = time()
+
+        self.pending = []   # rows as tuples, turned into columns when flushed
+        self.rows = 0
+        self.lock = threading.Lock()        # guards pending
+        self.write_lock = threading.Lock()  # keeps flushes in order
+        self.wake = threading.Event()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        # in case the program exits before close()
+        atexit.register(self.close)
+
+    def record(self, **row):
+        """adds a row; columns not given are NaN"""
+        row.setdefault('wall_time', time() - self.start)
+        row = tuple([row.get(column, np.nan) for column in COLUMNS])
+        with self.lock:
+            self.pending.append(row)
+            self.rows += 1
+            full = len(self.pending) >= self.flush_every
+        self.rolling.add(row)
+        if full:
+            self.wake.set()
+        if self.report_every and self.rows % self.report_every == 0:
+            print(self.status())
+
+    def record_episode(self, agent, score, frames):
+        """records an episode that a QLearner has just learned from"""
+        self.record(episode=agent.episodes, score=score, frames=frames, epsilon=agent._get_current_epsilon(),
+                    states=len(agent.q_values), updates_per_s=agent.updates_per_second)
+
+    def status(self):
+        rolling = self.rolling
+        return '{} episodes; last {}: mean score {:.2f}, best {:.0f}; {:.0f} states, {:.0f} updates/s, {} exploration factor' \
+            .format(self.rows, len(rolling.rows), rolling.mean('score'), rolling.max('score'),
+                    rolling.max('states'), rolling.mean('updates_per_s'), rolling.values('epsilon')[-1])
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+            if not pending:
+                return
+            columns = np.array(pending, dtype='<f8').T
+            for column, values in zip(COLUMNS, columns):
+                with open(_column_path(self.directory, column), 'ab') as outfile:
+                    outfile.write(values.tobytes())
+
+    def close(self):
+        """stops the writer thread and flushes the rows left"""
+        if not self.closed:
+            self.closed = True
+            self.wake.set()
+            self.thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self.closed:
+            self.wake.wait(self.flush_seconds)
+            self.wake.clear()
+            self.flush()
+
+
+def _column_path(directory, column):
+    return os.path.join(directory, column + '.f8')
+
+
+def _align(directory):
+    """cuts every column file to the rows that all of them hold"""
+    paths = [_column_path(directory, column) for column in COLUMNS]
+    sizes = [os.path.getsize(path) if os.path.isfile(path) else 0 for path in paths]
+    size = min(sizes) // 8 * 8
+    for path, path_size in zip(paths, sizes):
+        if path_size > size:
+            with open(path, 'r+b') as outfile:
+                outfile.truncate(size)
+
+
+def load(directory=METRICS_DIR):
+    """{column: array}; a flush cut short leaves some columns longer, so all
+    are cut to the shortest"""
+    columns = {}
+    for column in COLUMNS:
+        path = _column_path(directory, column)
+        columns[column] = np.fromfile(path, dtype='<f8') if os.path.isfile(path) else np.zeros(0)
+    rows = min(len(values) for values in columns.values())
+    return dict((column, values[:rows]) for column, values in columns.items())
+
+
+def rolling_mean(values, window=100):
+    """mean of every `window` consecutive values"""
+    sums = np.cumsum(np.insert(values, 0, 0.0))
+    return (sums[window:] - sums[:-window]) / window
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'csv':
+        print('usage: python metrics.py csv [directory]')
+        sys.exit(1)
+    columns = load(sys.argv[2] if len(sys.argv) > 2 else METRICS_DIR)
+    print(','.join(COLUMNS))
+    for row in zip(*[columns[column] for column in COLUMNS]):
+        print(','.join('{:g}'.format(value) for value in row))
@@ -1,61 +1,132 @@
-from itertools import cycle
-import random
-import sys
-
-import pygame
-from pygame.locals import *
+import assets
 from pipes import PIPES
-from copy import deepcopy
-
-PIPE_IND = 0
-SCORE_GOAL = 100
-FPS = 3000
-SCREENWIDTH = 288
-SCREENHEIGHT = 512
-playerMaxVelY = 10   # max vel along Y, max descend speed
-playerMinVelY = -8   # min vel along Y, max ascend speed
-pipeVelX = -4
-playerFlapAcc = -9   # players speed on flapping
-
-PIPE_GAP_SIZE = 100
-BASE_Y = SCREENHEIGHT * 0.79
-IMAGES, SOUNDS, HITMASKS = {}, {}, {}
-
-
-
-class FB_State:
-
-    def __init__(self):
-        self.score = 0
-        self.x = 0
-        self.y = 0
-        self.velx = 0
-        self.vely = 0
-        self.acc = 0
-        self.index = 0
-        self.pipeindex = 0
-        self.crashed = False
-        self.upipes = []
-        self.lpipes = []
+from collision import load_hitmasks, pipe_table
+from physics import SCREENWIDTH, SCREENHEIGHT, PLAYER_X, PLAYER_INDEX_CYCLE, \
+    pipeVelX, playerFlapAcc, can_flap, floor_y, step_function
 
-    def __repr__(self):
-        return str((self.score,
-                    self.x,
-                    self.y,
-                    self.velx,
-                    self.vely,
-                    self.acc,
-                    self.index,
-                    self.pipeindex,
-                    self.crashed,
-                    tuple(self.upipes),
-                    tuple(self.lpipes),
-                    ))
-    # unique hash function uses builtin hashing of python string representation
-    # of the state. Clever!
+IMAGES, HITMASKS = {}, {}
+
+
+class Layout(object):
+    """Pipes, score and the bird's animation frame at one frame of the
+    deterministic game. They do not depend on the bird's moves, so every
+    state at that frame shares one Layout."""
+
+    __slots__ = ('pipes', 'pipeindex', 'score', 'index', 'upperPipes', 'lowerPipes')
+
+    def __init__(self, pipes, pipeindex, score, index, upperPipes, lowerPipes):
+        self.pipes = pipes              # (x, k) pairs, k indexing PIPES
+        self.pipeindex = pipeindex      # next PIPES entry to spawn
+        self.score = score
+        self.index = index              # player sprite, as animated by the game
+        # the pipes the bird is tested against on arriving at this frame:
+        # moved, but before this frame's spawning and despawning
+        self.upperPipes = upperPipes
+        self.lowerPipes = lowerPipes
+
+
+LAYOUTS = []
+
+
+def frameLayout(frame):
+    """returns the Layout of the given frame, extending LAYOUTS as needed"""
+    if frame < len(LAYOUTS):
+        return LAYOUTS[frame]
+    while len(LAYOUTS) <= frame:
+        if not LAYOUTS:
+            # the first 2 pipes of PIPES, the second half a screen behind the first
+            pipes = ((SCREENWIDTH + 200, 0), (SCREENWIDTH + 200 + (SCREENWIDTH / 2), 1))
+            LAYOUTS.append(Layout(pipes, 2, 0, 0, [], []))
+            continue
+
+        prev = LAYOUTS[-1]
+        pipeWidth = IMAGES['pipe'][0].get_width()
+        playerMidPos = FB_State.x + IMAGES['player'][0].get_width() / 2
+
+        # move pipes to left
+        moved = tuple((x + pipeVelX, k) for x, k in prev.pipes)
+
+        # check for score
+        score = prev.score
+        for x, _ in moved:
+            pipeMidPos = x + pipeWidth / 2
+            if pipeMidPos <= playerMidPos < pipeMidPos + 4:
+                score += 1
+
+        # add new pipe when first pipe is about to touch left of screen
+        pipes, pipeindex = moved, prev.pipeindex
+        if 0 < moved[0][0] < 5:
+            pipes += ((PIPES[pipeindex][0]['x'], pipeindex),)
+            pipeindex += 1
+
+        # remove first pipe if its out of the screen
+        if pipes[0][0] < -pipeWidth:
+            pipes = pipes[1:]
+
+        # the game moves to the next sprite of PLAYER_INDEX_CYCLE every third frame
+        frame = len(LAYOUTS)
+        index = PLAYER_INDEX_CYCLE[(frame // 3 - 1) % 4] if frame % 3 == 0 else prev.index
+
+        LAYOUTS.append(Layout(pipes, pipeindex, score, index,
+                              [{'x': x, 'y': PIPES[k][0]['y']} for x, k in moved],
+                              [{'x': x, 'y': PIPES[k][1]['y']} for x, k in moved]))
+    return LAYOUTS[frame]
+
+
+class FB_State(object):
+    """Immutable search state: the frame and the bird's y, velocity and
+    crash flag. Pipes and score are a function of the frame alone and are
+    looked up in the shared frame Layout. Equality and hashing go through a
+    tuple of the fields, built once."""
+
+    __slots__ = ('frame', 'y', 'vely', 'crashed', 'key', 'hash')
+
+    # the same for every state of the search
+    x = PLAYER_X
+
+    def __init__(self, frame, y, vely, crashed):
+        self.frame = frame
+        self.y = y
+        self.vely = vely
+        self.crashed = crashed
+        self.key = (frame, y, vely, crashed)
+        self.hash = hash(self.key)
+
+    @property
+    def score(self):
+        return frameLayout(self.frame).score
+
+    @property
+    def pipeindex(self):
+        return frameLayout(self.frame).pipeindex
+
+    @property
+    def pipes(self):
+        return frameLayout(self.frame).pipes
+
+    @property
+    def index(self):
+        return frameLayout(self.frame).index
+
+    @property
+    def upipes(self):
+        return [{'x': x, 'y': PIPES[k][0]['y']} for x, k in self.pipes]
+
+    @property
+    def lpipes(self):
+        return [{'x': x, 'y': PIPES[k][1]['y']} for x, k in self.pipes]
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __ne__(self, other):
+        return self.key != other.key
 
     def __hash__(self):
-        return hash(repr(self))
+        return self.hash
+
+    def __repr__(self):
+        return 'FB_State' + repr(self.key)
 
     def __str__(self):
         return repr(self)
@@ -71,189 +142,81 @@ class Node:
 
 # Get start state
 def getStart():
-    state = FB_State()
-    state.score = int(0)
-    state.index = 0
-    state.x = int(SCREENWIDTH * 0.2)
-    state.y = int((SCREENHEIGHT - IMAGES['player'][0].get_height()) / 2)
-    # get 2 new pipes to add to upperPipes lowerPipes list
-    newPipe1 = PIPES[0]
-    newPipe2 = PIPES[1]
-    state.crashed = False
-    state.pipeindex = 2
-
-    # list of upper pipes
-    state.upipes = [
-        {'x': SCREENWIDTH + 200, 'y': newPipe1[0]['y']},
-        {'x': SCREENWIDTH + 200 + (SCREENWIDTH / 2), 'y': newPipe2[0]['y']},
-    ]
-
-    # list of lowerpipe
-    state.lpipes = [
-        {'x': SCREENWIDTH + 200, 'y': newPipe1[1]['y']},
-        {'x': SCREENWIDTH + 200 + (SCREENWIDTH / 2), 'y': newPipe2[1]['y']},
-    ]
-
-    # player velocity, max velocity, downward accleration, accleration on flap
-    state.vely = -9   # player's velocity along Y, default same as playerFlapped
-    state.acc = 1   # players downward accleration
+    # player's velocity along Y starts the same as playerFlapped
+    state = FB_State(frame=0,
+                     y=int((SCREENHEIGHT - IMAGES['player'][0].get_height()) / 2),
+                     vely=playerFlapAcc,
+                     crashed=False)
     return Node(state)
 
 
 def isGoalState(state, num_pipes):
-    return state.score == num_pipes
+    # macro-actions may jump past the frame where the score is reached
+    return state.score >= num_pipes
 
 expanded = 0
-def getSuccessors(state):
+def getSuccessors(state, margin=0):
     if state.crashed:
         return []
     global expanded
     expanded += 1
     successors = []
     for flapped in [True, False]:
+        newState = advance(state, flapped, margin)
+        if newState is not None:
+            successors.append(Node(newState, flapped))
+    return successors
 
-        newState = deepcopy(state)
-
-        if flapped:
-            if newState.y > -2 * IMAGES['player'][0].get_height():
-                newState.vely = playerFlapAcc
-            else:
-                continue
-
-        # player movement
-        if newState.vely < playerMaxVelY and not flapped:
-            newState.vely += newState.acc
-
-        playerHeight = IMAGES['player'][newState.index].get_height()
-        newState.y += min(newState.vely, BASE_Y - newState.y - playerHeight)
 
-        # move pipes to left
-        for uPipe, lPipe in zip(newState.upipes, newState.lpipes):
-            uPipe['x'] += pipeVelX
-            lPipe['x'] += pipeVelX
+def getMacroSuccessors(state, k, margin=0):
+    """successors reached by the macro-actions "fall for j frames, then flap"
+    for j in 0..k-1, plus "fall for k frames". Each node's flapped is the
+    tuple of per-frame actions. Macros that crash on the way are dropped."""
+    if state.crashed:
+        return []
+    global expanded
+    expanded += 1
+    successors = []
+    falling = state
+    for falls in range(k):
+        flapping = advance(falling, True, margin)
+        if flapping is not None and not flapping.crashed:
+            successors.append(Node(flapping, (False,) * falls + (True,)))
+        falling = advance(falling, False, margin)
+        if falling.crashed:
+            return successors
+    successors.append(Node(falling, (False,) * k))
+    return successors
 
-        crashTest = checkCrash({'x': newState.x, 'y': newState.y, 'index': newState.index},
-                               newState.upipes, newState.lpipes)
-        # if crash, not a successor
-        if crashTest[0]:
-            newState.crashed = True
 
-        # check for score
-        playerMidPos = newState.x + IMAGES['player'][0].get_width() / 2
-        for pipe in newState.upipes:
-            pipeMidPos = pipe['x'] + IMAGES['pipe'][0].get_width() / 2
-            if pipeMidPos <= playerMidPos < pipeMidPos + 4:
-                newState.score = int(newState.score + 1)
+def advance(state, flapped, margin=0):
+    """returns the state one frame after state, or None if the bird is too
+    high to flap. With a margin, the bird also crashes when it would with
+    its y margin pixels higher or lower."""
+    if flapped and not can_flap(state.y, PLAYER_H):
+        return None
 
-        # add new pipe when first pipe is about to touch left of screen
-        if 0 < newState.upipes[0]['x'] < 5:
-            newPipe = PIPES[newState.pipeindex]
-            newState.pipeindex += 1
-            newState.upipes.append(newPipe[0])
-            newState.lpipes.append(newPipe[1])
+    # the game tests the new position with the sprite and pipes of the new
+    # frame
+    frame = state.frame + 1
+    layout = LAYOUTS[frame] if frame < len(LAYOUTS) else frameLayout(frame)
+    y, vely, crashed = STEP(state.y, state.vely, flapped, layout.index, layout.upperPipes, layout.lowerPipes)
+    if margin and not crashed:
+        crashed = y + margin >= floor_y(PLAYER_H) or y - margin <= 0 or any(
+            PIPE_TABLE.collides_pipes(layout.index, PLAYER_X, y + offset, layout.upperPipes, layout.lowerPipes)
+            for offset in (-margin, margin))
 
-        # remove first pipe if its out of the screen
-        if newState.upipes[0]['x'] < -IMAGES['pipe'][0].get_width():
-            newState.upipes.pop(0)
-            newState.lpipes.pop(0)
-        successors.append(Node(newState, flapped))
-    return successors
+    return FB_State(frame, y, vely, crashed)
 
 
 def initialize():
-    global SCREEN, FPSCLOCK
-    pygame.init()
-    FPSCLOCK = pygame.time.Clock()
-    SCREEN = pygame.display.set_mode((SCREENWIDTH, SCREENHEIGHT))
-
-    # base (ground) sprite
-    IMAGES['base'] = pygame.image.load(
-        './assets/sprites/base.png').convert_alpha()
-
-    IMAGES['background'] = pygame.image.load('assets/sprites/background-day.png').convert()
-
-    IMAGES['player'] = (
-        pygame.image.load('assets/sprites/bluebird-upflap.png').convert_alpha(),
-        pygame.image.load('assets/sprites/bluebird-midflap.png').convert_alpha(),
-        pygame.image.load('assets/sprites/bluebird-downflap.png').convert_alpha(),
-    )
-
-    IMAGES['pipe'] = (
-        pygame.transform.rotate(
-            pygame.image.load('assets/sprites/pipe-green.png').convert_alpha(), 180),
-        pygame.image.load('assets/sprites/pipe-green.png').convert_alpha(),
-    )
-
-    # hismask for pipes
-    HITMASKS['pipe'] = (
-        getHitmask(IMAGES['pipe'][0]),
-        getHitmask(IMAGES['pipe'][1]),
-    )
-
-    # hitmask for player
-    HITMASKS['player'] = (
-        getHitmask(IMAGES['player'][0]),
-        getHitmask(IMAGES['player'][1]),
-        getHitmask(IMAGES['player'][2]),
-    )
-
-def getHitmask(image):
-    """returns a hitmask using an image's alpha."""
-    mask = []
-    for x in range(image.get_width()):
-        mask.append([])
-        for y in range(image.get_height()):
-            mask[x].append(bool(image.get_at((x, y))[3]))
-    return mask
-
-def checkCrash(player, upperPipes, lowerPipes):
-    """returns True if player collders with base or pipes."""
-    pi = player['index']
-    player['w'] = IMAGES['player'][0].get_width()
-    player['h'] = IMAGES['player'][0].get_height()
-
-    # if player crashes into ground
-    if player['y'] + player['h'] >= BASE_Y - 1:
-        return [True, True]
-    else:
-
-        playerRect = pygame.Rect(player['x'], player['y'],
-                                 player['w'], player['h'])
-        pipeW = IMAGES['pipe'][0].get_width()
-        pipeH = IMAGES['pipe'][0].get_height()
-
-        for uPipe, lPipe in zip(upperPipes, lowerPipes):
-            # upper and lower pipe rects
-            uPipeRect = pygame.Rect(uPipe['x'], uPipe['y'], pipeW, pipeH)
-            lPipeRect = pygame.Rect(lPipe['x'], lPipe['y'], pipeW, pipeH)
-
-            # player and upper/lower pipe hitmasks
-            pHitMask = HITMASKS['player'][pi]
-            uHitmask = HITMASKS['pipe'][0]
-            lHitmask = HITMASKS['pipe'][1]
-
-            # if bird collided with upipe or lpipe
-            uCollide = pixelCollision(playerRect, uPipeRect, pHitMask, uHitmask)
-            lCollide = pixelCollision(playerRect, lPipeRect, pHitMask, lHitmask)
-
-            if uCollide or lCollide:
-                return [True, False]
-
-    return [False, False]
-
-
-def pixelCollision(rect1, rect2, hitmask1, hitmask2):
-    """Checks if two objects collide and not just their rects"""
-    rect = rect1.clip(rect2)
-
-    if rect.width == 0 or rect.height == 0:
-        return False
-
-    x1, y1 = rect.x - rect1.x, rect.y - rect1.y
-    x2, y2 = rect.x - rect2.x, rect.y - rect2.y
-
-    for x in xrange(rect.width):
-        for y in xrange(rect.height):
-            if hitmask1[x1 + x][y1 + y] and hitmask2[x2 + x][y2 + y]:
-                return True
-    return False
+    """loads the sprite sizes and hitmasks search needs, without pygame or
+    a display; see assets.py"""
+    global PIPE_TABLE, STEP, PLAYER_H
+    IMAGES.update(assets.images())
+
+    # hitmasks for pipes and player
+    HITMASKS.update(load_hitmasks())
+    PIPE_TABLE = pipe_table(HITMASKS)
+    STEP = step_function(PIPE_TABLE)
+    PLAYER_H = PIPE_TABLE.player_h
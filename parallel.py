@@ -0,0 +1,105 @@
+"""Search across a process pool.
+
+sweep() fans (strategy, size) problems out to a multiprocessing pool and
+yields each result as soon as its worker finishes, so a long analysis.py
+style sweep reports progress instead of going quiet until the end.
+
+race() is a portfolio: it runs several strategies on one problem at once,
+returns the first solution and terminates the workers still searching.
+
+Strategies are named, so only strings and numbers cross the process
+boundary; every worker initializes node_util once.
+"""
+import multiprocessing
+import sys
+from time import time
+
+import algs
+import node_util
+import structs
+
+
+def _astar_cost(successor):
+    return algs.heuristic(successor)
+
+
+def _frames_cost(successor):
+    # path cost is the number of frames; the fringe needs a priority
+    return successor.state.frame
+
+
+# name -> (fringe, cost function)
+STRATEGIES = {
+    'dfs': (structs.Stack, None),
+    'bfs': (structs.Queue, None),
+    'ucs': (structs.PriorityQueue, _frames_cost),
+    'astar': (structs.PriorityQueue, _astar_cost),
+}
+
+
+def solve(task):
+    """runs one (strategy, size) search in a worker; returns a result dict
+    with the path, or path None if the problem has no solution"""
+    strategy, size = task
+    structure, cost_function = STRATEGIES[strategy]
+    start = time()
+    found = algs.search(structure, size, cost_function)
+    path, expanded = found if found is not None else (None, None)
+    return {'strategy': strategy, 'size': size, 'seconds': time() - start,
+            'expanded': expanded, 'path': path}
+
+
+def sweep(sizes, strategies=('astar',), processes=None):
+    """yields the result of every (strategy, size), in completion order"""
+    tasks = [(strategy, size) for size in sizes for strategy in strategies]
+    pool = multiprocessing.Pool(processes, node_util.initialize)
+    try:
+        for result in pool.imap_unordered(solve, tasks):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def race(size, strategies=('astar', 'dfs'), processes=None):
+    """returns the result of the first strategy to solve size pipes, or None
+    if none of them can. The other searches are cancelled."""
+    pool = multiprocessing.Pool(processes or len(strategies), node_util.initialize)
+    try:
+        for result in pool.imap_unordered(solve, [(strategy, size) for strategy in strategies]):
+            if result['path'] is not None:
+                return result
+        return None
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _report(result):
+    frames = len(result['path']) if result['path'] is not None else None
+    print('{:6} {:4} pipes: {:8.3f}s {:8} expanded {:8} frames'.format(
+        result['strategy'], result['size'], result['seconds'], result['expanded'], frames))
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == 'race':
+        start = time()
+        winner = race(int(sys.argv[2]), sys.argv[3:] or ('astar', 'dfs'))
+        if winner is None:
+            print('no strategy found a solution')
+        else:
+            _report(winner)
+            print('won in {:.3f}s'.format(time() - start))
+    elif len(sys.argv) > 1 and sys.argv[1] == 'sweep':
+        largest, step = [int(arg) for arg in sys.argv[2:4]] + [450, 20][len(sys.argv[2:4]):]
+        strategies = sys.argv[4:] or ('astar',)
+        start = time()
+        for result in sweep(range(20, largest + 1, step), strategies):
+            _report(result)
+        print('total: {:.3f}s'.format(time() - start))
+    else:
+        print('usage: python parallel.py sweep [largest [step [strategy ...]]]')
+        print('       python parallel.py race size [strategy ...]')
+        print('strategies: ' + ', '.join(sorted(STRATEGIES)))
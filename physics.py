@@ -0,0 +1,246 @@
+"""The rules of Flappy Bird, shared by the game, search and training.
+
+The constants of the game live here and nowhere else, as does the motion of
+the bird and its crash test. FlappySim (and so flappy.main_game, QLearner
+and q_parallel), node_util's search states, Planner and BatchFlappySim all
+move the bird with this module:
+
+    move(y, vel_y, flap, floor_y)      one frame of the bird, plain ints
+    crashed(table, y, index, upper_pipes, lower_pipes)
+    step_function(table)               both of the above, compiled into one
+                                       closure for the hot loops
+    plain_step(table, y, vel_y, flap, index, upper_pipes, lower_pipes)
+                                       the same, through move() and crashed()
+    move_batch(y, vel_y, flap, floor_y)
+                                       move() for NumPy arrays of birds
+
+A crash is the bird touching the base, reaching the top of the screen
+(y <= 0) or overlapping a pipe. Positions are whole pixels: a bird of
+height h whose y reaches floor_y(h) = int(BASE_Y) - h lies on the base,
+which is the game's y + h >= BASE_Y - 1 test, and the base stops it there.
+
+    python physics.py verify [path.json ...]
+
+replays action lists, planned search paths such as flappy.py -s writes,
+through node_util, FlappySim and BatchFlappySim and checks that all three
+see the same frames: the bird's y and velocity, the crash and the score.
+Without arguments it replays path.json, or plans a 20-pipe path if there
+is none.
+"""
+from itertools import count
+import json
+import os
+import random
+import sys
+
+from collision import pipe_table
+
+SCREENWIDTH = 288
+SCREENHEIGHT = 512
+PIPE_GAP_SIZE = 100
+BASE_Y = SCREENHEIGHT * 0.79
+
+pipeVelX = -4
+playerMaxVelY = 10   # max vel along Y, max descend speed
+playerAccY = 1       # players downward accleration
+playerFlapAcc = -9   # players speed on flapping
+
+PLAYER_X = int(SCREENWIDTH * 0.2)
+PLAYER_INDEX_CYCLE = (0, 1, 2, 1)
+
+FALL, FLAP = 0, 1
+
+
+def floor_y(player_h):
+    """the y at which a bird of height player_h lies on the base"""
+    return int(BASE_Y) - player_h
+
+
+def can_flap(y, player_h):
+    """the game ignores flaps once the bird is two heights above the screen"""
+    return y > -2 * player_h
+
+
+def move(y, vel_y, flap, floor_y):
+    """returns the bird's y and velocity one frame later; flap must be
+    allowed by can_flap"""
+    if flap:
+        vel_y = playerFlapAcc
+    elif vel_y < playerMaxVelY:
+        vel_y += playerAccY
+    return min(y + vel_y, floor_y), vel_y
+
+
+def crashed(table, y, index, upper_pipes, lower_pipes):
+    """whether the bird at y, drawn with sprite index, has crashed; table is
+    the PipeCollisionTable of its hitmasks"""
+    return y >= floor_y(table.player_h) or y <= 0 or \
+        table.collides_pipes(index, PLAYER_X, y, upper_pipes, lower_pipes)
+
+
+def plain_step(table, y, vel_y, flap, index, upper_pipes, lower_pipes):
+    """a step of step_function(table), as calls to move() and crashed()"""
+    y, vel_y = move(y, vel_y, flap, floor_y(table.player_h))
+    return y, vel_y, crashed(table, y, index, upper_pipes, lower_pipes)
+
+
+_steps = {}
+INLINE = True   # profiling turns this off to time the collision test
+
+
+def step_function(table):
+    """returns step(y, vel_y, flap, index, upper_pipes, lower_pipes), which
+    moves the bird one frame and tests the new position against the pipes
+    of the new frame: (y, vel_y, crashed), exactly as move() then crashed().
+    Constants and the collision table are bound as locals, so a step is a
+    single call without global or attribute lookups. With INLINE off, the
+    step goes through plain_step instead."""
+    if not INLINE:
+        return lambda *frame: plain_step(table, *frame)
+    if table in _steps:
+        return _steps[table]
+
+    def step(y, vel_y, flap, index, upper_pipes, lower_pipes,
+             flap_acc=playerFlapAcc, max_vel=playerMaxVelY, acc=playerAccY, floor=floor_y(table.player_h),
+             x=PLAYER_X, data=table.data, dx_min=table.dx_min, dx_max=table.dx_max, dy_min=table.dy_min,
+             dy_max=table.dy_max, dx_span=table.dx_span, dy_span=table.dy_span):
+        if flap:
+            vel_y = flap_acc
+        elif vel_y < max_vel:
+            vel_y += acc
+        y += vel_y
+        if y >= floor:
+            return floor, vel_y, True
+        if y <= 0:
+            return y, vel_y, True
+
+        # PipeCollisionTable.collides_pipes, inlined
+        for u_pipe, l_pipe in zip(upper_pipes, lower_pipes):
+            dx = u_pipe['x'] - x
+            if not dx_min < dx < dx_max:
+                continue
+            column = ((index * 2) * dx_span + dx - dx_min - 1) * dy_span - dy_min - 1
+            dy = u_pipe['y'] - y
+            if dy_min < dy < dy_max and data[column + dy]:
+                return y, vel_y, True
+            dy = l_pipe['y'] - y
+            if dy_min < dy < dy_max and data[column + dx_span * dy_span + dy]:
+                return y, vel_y, True
+        return y, vel_y, False
+
+    _steps[table] = step
+    return step
+
+
+def move_batch(y, vel_y, flap, floor_y):
+    """move() for NumPy arrays of birds, flap being a boolean array: returns
+    new y and vel_y arrays"""
+    vel_y = vel_y + (vel_y < playerMaxVelY) * playerAccY
+    vel_y[flap] = playerFlapAcc
+    y = y + vel_y
+    y[y > floor_y] = floor_y
+    return y, vel_y
+
+
+def _search_trajectory(actions):
+    import node_util
+    state = node_util.getStart().state
+    frames = []
+    for action in actions:
+        state = node_util.advance(state, action)
+        frames.append((state.frame, state.y, state.vely, state.crashed, node_util.frameLayout(state.frame - 1).score))
+        if state.crashed:
+            break
+    return frames
+
+
+def _sim_trajectory(actions):
+    from pipes import PIPES
+    from collision import load_hitmasks
+    from sim import FlappySim
+    sim = FlappySim(load_hitmasks(), pipe_source=PIPES.source())
+    sim.reset()
+    frames = []
+    for action in actions:
+        sim.step(action)
+        frames.append((sim.frames, sim.player_y, sim.player_vel_y, sim.hit, sim.score))
+        if sim.hit:
+            break
+    return frames
+
+
+def _batch_trajectory(actions):
+    from pipes import PIPES
+    from collision import load_hitmasks
+    from batch_sim import BatchFlappySim
+    indices = count()
+    batch = BatchFlappySim(1, load_hitmasks(), gap_source=lambda size: [PIPES.gap(next(indices)) for _ in range(size)])
+    frames = []
+    for action in actions:
+        batch.step([action])
+        frames.append((int(batch.frames[0]), int(batch.player_y[0]), int(batch.player_vel_y[0]),
+                       bool(batch.check_crash()[0]), int(batch.score[0])))
+        if frames[-1][3]:
+            break
+    return frames
+
+
+def verify(paths):
+    """replays every action list through the three consumers; returns the
+    number of lists whose trajectories differ"""
+    import node_util
+    node_util.initialize()
+    failures = 0
+    for path in paths:
+        if os.path.isfile(path):
+            with open(path) as infile:
+                actions = json.load(infile)
+        else:
+            import algs
+            import structs
+            print('{} not found; planning 20 pipes'.format(path))
+            actions = algs.search(structs.PriorityQueue, 20, algs.heuristic)[0]
+
+        trajectories = [('node_util', _search_trajectory(actions)), ('FlappySim', _sim_trajectory(actions)),
+                        ('BatchFlappySim', _batch_trajectory(actions))]
+        reference = trajectories[0][1]
+        mismatches = []
+        for name, frames in trajectories[1:]:
+            for i, (expected, found) in enumerate(zip(reference, frames)):
+                if expected != found:
+                    mismatches.append('{} frame {}: {} != node_util {}'.format(name, i + 1, found, expected))
+                    break
+            else:
+                if len(frames) != len(reference):
+                    mismatches.append('{} ran {} frames, node_util {}'.format(name, len(frames), len(reference)))
+        last = reference[-1]
+        print('{}: {} actions, {} frames, {}, score {}: {}'.format(
+            path, len(actions), len(reference), 'crashed' if last[3] else 'alive', last[4],
+            'identical' if not mismatches else 'MISMATCH'))
+        for mismatch in mismatches:
+            print('  ' + mismatch)
+        failures += bool(mismatches)
+
+    # the compiled step against move() and crashed(), from random states
+    from collision import load_hitmasks
+    table = pipe_table(load_hitmasks())
+    step, floor = step_function(table), floor_y(table.player_h)
+    rng = random.Random(0)
+    wrong = 0
+    for _ in range(100000):
+        y, vel_y, flap, index = rng.randrange(-60, floor), rng.randrange(-9, 11), rng.random() < 0.5, rng.randrange(3)
+        x = rng.randrange(-60, 120)
+        upper, lower = [{'x': x, 'y': rng.randrange(-300, -60)}], [{'x': x, 'y': rng.randrange(100, 400)}]
+        new_y, new_vel = move(y, vel_y, flap, floor)
+        expected = (new_y, new_vel, crashed(table, new_y, index, upper, lower))
+        if step(y, vel_y, flap, index, upper, lower) != expected or \
+                plain_step(table, y, vel_y, flap, index, upper, lower) != expected:
+            wrong += 1
+    print('compiled and plain steps: {} of 100000 random frames differ from move() and crashed()'.format(wrong))
+    return failures + bool(wrong)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'verify':
+        sys.exit(1 if verify(sys.argv[2:] or ['path.json']) else 0)
+    print('usage: python physics.py verify [path.json ...]')
@@ -0,0 +1,70 @@
+"""Endless, reproducible pipe sequences.
+
+A PipeSequence is indexed like a list of [upper, lower] pipe pairs, but
+never ends: pipe i is generated on first use from (seed, i) alone, with the
+distribution of flappy.get_random_pipe, so any pipe can be looked up
+without generating the ones before it. Recently used pipes are kept in a
+small LRU. A fixed prefix, such as the table in pipes.py, can be put in
+front of the generated pipes.
+
+Sequences are shared between search, replay and training, so the pipe
+dicts they hand out must not be modified; sim.FlappySim copies them.
+"""
+from collections import OrderedDict
+from itertools import count
+import random
+
+import assets
+from physics import SCREENWIDTH, PIPE_GAP_SIZE, BASE_Y
+
+
+class PipeSequence(object):
+
+    def __init__(self, seed=0, prefix=(), cache_size=1024, pipe_height=None):
+        """pipe_height defaults to the height of the pipe sprite"""
+        self.seed = seed
+        self.prefix = list(prefix)
+        self.cache_size = cache_size
+        self.pipe_height = pipe_height if pipe_height is not None else assets.sprite(assets.PIPE).height
+        self.cache = OrderedDict()
+
+    def gap(self, index):
+        """y of the top of gap `index`, as get_random_pipe draws it"""
+        if index < len(self.prefix):
+            return self.prefix[index][0]['y'] + self.pipe_height
+        rng = random.Random(self.seed * 0x100000000 + index)
+        return rng.randrange(0, int(BASE_Y * 0.6 - PIPE_GAP_SIZE)) + int(BASE_Y * 0.2)
+
+    def __getitem__(self, index):
+        if not isinstance(index, (int, long)):
+            raise TypeError('PipeSequence indices must be integers')
+        if index < 0:
+            raise IndexError('PipeSequence is endless; negative indices have no pipe')
+        if index < len(self.prefix):
+            return self.prefix[index]
+
+        cache = self.cache
+        if index in cache:
+            pipe = cache.pop(index)
+        else:
+            gap_y = self.gap(index)
+            pipe = [
+                {'x': SCREENWIDTH + 10, 'y': gap_y - self.pipe_height},  # upper pipe
+                {'x': SCREENWIDTH + 10, 'y': gap_y + PIPE_GAP_SIZE},  # lower pipe
+            ]
+            if len(cache) >= self.cache_size:
+                cache.popitem(last=False)
+        cache[index] = pipe
+        return pipe
+
+    def __iter__(self):
+        index = 0
+        while True:
+            yield self[index]
+            index += 1
+
+    def source(self, start=0):
+        """returns a callable handing out pipes start, start + 1, ... for
+        FlappySim's pipe_source; each game should take its own"""
+        indices = count(start)
+        return lambda: self[next(indices)]
@@ -1,4 +1,8 @@
-PIPES = [
+# The pipes of the deterministic game that search solves: the first 491 are
+# this fixed table, the rest are drawn by PipeSequence with seed 0.
+from pipe_sequence import PipeSequence
+
+FIXED_PIPES = [
 [{'y': -123, 'x': 298}, {'y': 297, 'x': 298}],
 [{'y': -183, 'x': 298}, {'y': 237, 'x': 298}],
 [{'y': -144, 'x': 298}, {'y': 276, 'x': 298}],
@@ -491,3 +495,5 @@ PIPES = [
 [{'y': -128, 'x': 298}, {'y': 292, 'x': 298}],
 [{'y': -230, 'x': 298}, {'y': 190, 'x': 298}]
 ]
+
+PIPES = PipeSequence(seed=0, prefix=FIXED_PIPES)
@@ -0,0 +1,179 @@
+"""Receding-horizon planner for games with random pipes.
+
+node_util and algs plan a whole game offline over pipes.PIPES. Planner
+instead plans online, from the FlappySim being played: every frame it
+needs a plan that survives the next `horizon` frames against the pipes on
+screen. Pipes spawn at the right edge, 52 frames from the bird, so pipes
+not yet seen cannot matter within a horizon of 50 frames; shorter
+horizons walk into gaps they cannot climb out of in time.
+
+The previous plan stays valid from one frame to the next: the planner
+takes its next action and only extends the tail to the full horizon. A
+pipe that appears meanwhile is too far right to touch the old plan, and
+can only make more states crash, so the states proved dead are kept too,
+keyed on the absolute frame, and never searched again. The planner only
+replans from the current frame when the tail cannot be extended.
+
+Each decision has a time budget; when it runs out the planner keeps the
+longest surviving prefix it found. take_action() records the latency of
+every decision in `latencies`.
+"""
+from collections import defaultdict
+import random
+import sys
+from time import time
+
+from collision import pipe_table
+from physics import PIPE_GAP_SIZE, BASE_Y, PLAYER_X, pipeVelX, can_flap, floor_y, move
+from sim import FlappySim
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+class Planner:
+
+    def __init__(self, hitmasks, horizon=50, budget=0.015):
+        self.horizon = horizon
+        self.budget = budget     # seconds per decision
+        self.table = pipe_table(hitmasks)
+        self.player_x = PLAYER_X
+        self.player_w, self.player_h = self.table.player_w, self.table.player_h
+        self.floor_y = floor_y(self.player_h)
+        self.latencies = []
+        self.reset()
+
+    def reset(self):
+        """forgets the plan, e.g. before a new game"""
+        self.plan = []      # actions from the current frame on
+        self.states = []    # (frame, y, vel_y) reached by each action
+        # per frame, so the past can be dropped cheaply:
+        self.dead = defaultdict(dict)    # frame -> (y, vel_y) -> frames it cannot survive
+        self.alive = defaultdict(dict)   # frame -> y -> whether the bird survives there
+
+    def take_action(self, sim):
+        """returns whether to flap on this frame of sim"""
+        start = time()
+        self.deadline = start + self.budget
+        if self.plan:
+            self.plan.pop(0)
+            self.states.pop(0)
+        for table in (self.dead, self.alive):
+            table.pop(sim.frames - 1, None)
+        self.pipes = [(u['x'] - sim.frames * pipeVelX, u['y'], l['y'])
+                      for u, l in zip(sim.upper_pipes, sim.lower_pipes)]
+
+        need = self.horizon - len(self.plan)
+        if need > 0:
+            now = (sim.frames, sim.player_y, sim.player_vel_y)
+            found = self._search(self.states[-1] if self.states else now, need)
+            if len(found) < need and self.plan:
+                # the old plan's tail is a dead end; try again from now
+                fresh = self._search(now, self.horizon)
+                if len(fresh) > len(self.plan) + len(found):
+                    self.plan, self.states, found = [], [], fresh
+            self.plan += [action for action, _ in found]
+            self.states += [state for _, state in found]
+
+        self.latencies.append(time() - start)
+        return bool(self.plan) and self.plan[0]
+
+    def _search(self, state, need):
+        """returns up to `need` (action, state) pairs surviving from state:
+        all of them, or the longest prefix found within the time budget"""
+        self.best = []
+        try:
+            found = self._extend(state[0], state[1], state[2], need, [])
+        except _OutOfTime:
+            found = None
+        return found if found is not None else self.best
+
+    def _alive(self, frame, y):
+        """whether the bird at y survives the crash test of that frame, with
+        any of its sprites. Every pipe that can reach the bird by then was on
+        screen when the frame was first tested, so answers are kept."""
+        known = self.alive[frame]
+        if y not in known:
+            # physics.crashed, for every sprite at once
+            alive = 0 < y < self.floor_y
+            if alive:
+                collides, shift = self.table.collides, frame * pipeVelX
+                for x, upper, lower in self.pipes:
+                    dx = x + shift - self.player_x
+                    if collides(0, 0, dx, upper - y) or collides(0, 1, dx, lower - y) or \
+                            collides(1, 0, dx, upper - y) or collides(1, 1, dx, lower - y) or \
+                            collides(2, 0, dx, upper - y) or collides(2, 1, dx, lower - y):
+                        alive = False
+                        break
+            known[y] = alive
+        return known[y]
+
+    def _gap_mid(self, frame):
+        # middle of the first gap the bird has not cleared
+        shift = frame * pipeVelX
+        for x, _, lower in self.pipes:
+            if x + shift + self.table.pipe_w > self.player_x:
+                return lower - PIPE_GAP_SIZE / 2 - self.player_h / 2
+        return BASE_Y / 2
+
+    def _extend(self, frame, y, vel_y, need, path):
+        """depth-first search for `need` more surviving frames after
+        (frame, y, vel_y); returns the list of (action, state) or None"""
+        if need == 0:
+            return path
+        if self.dead[frame].get((y, vel_y), need + 1) <= need:
+            return None
+        if time() > self.deadline:
+            raise _OutOfTime()
+
+        successors = []
+        for flap in (True, False):
+            if flap and not can_flap(y, self.player_h):
+                continue
+            new_y, vel = move(y, vel_y, flap, self.floor_y)
+            successors.append((abs(new_y - self._gap_mid(frame + 1)), flap, new_y, vel))
+
+        for _, flap, new_y, vel in sorted(successors):
+            if not self._alive(frame + 1, new_y):
+                continue
+            path.append((flap, (frame + 1, new_y, vel)))
+            if len(path) > len(self.best):
+                self.best = list(path)
+            if self._extend(frame + 1, new_y, vel, need - 1, path) is not None:
+                return path
+            path.pop()
+        self.dead[frame][y, vel_y] = need
+        return None
+
+    def percentiles(self, points=(50, 90, 99, 100)):
+        """decision latency percentiles in milliseconds"""
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return {}
+        return dict((p, 1000 * latencies[min(len(latencies) - 1, len(latencies) * p // 100)])
+                    for p in points)
+
+
+def play(planner, sim, max_frames=None):
+    """plays one game of sim with planner and returns its score"""
+    planner.reset()
+    sim.reset()
+    while max_frames is None or sim.frames < max_frames:
+        if sim.step(planner.take_action(sim))[2]:
+            break
+    return sim.score
+
+
+if __name__ == '__main__':
+    from collision import load_hitmasks
+
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    hitmasks = load_hitmasks()
+    planner = Planner(hitmasks)
+    sim = FlappySim(hitmasks, rng=random.Random(0))
+    for game in range(games):
+        score = play(planner, sim, max_frames=20000)
+        print('game {:3}: score {:5}'.format(game, score))
+    print('decision latency (ms): ' + ', '.join(
+        'p{} {:.3f}'.format(p, ms) for p, ms in sorted(planner.percentiles().items())))
@@ -0,0 +1,164 @@
+"""Opt-in timers around the hot paths of the game, search and learner.
+
+Nothing is instrumented until enable() is called: it replaces each function
+in HOOKS with a wrapper that counts and times its calls, and disable()
+puts the originals back, so disabled instrumentation costs nothing at all.
+Only modules already imported are hooked. Timings are inclusive: the
+successors timer also covers the advance calls it makes, and
+fringe.push_many the fringe.push calls of priority queues. The physics
+step of search and FlappySim has the collision test inlined; while the
+timers are on, it is built from plain_step instead, so the step timer and
+the collision timer inside it see every frame. FlappySims created before
+enable() keep the inlined step.
+
+report() summarizes every timer: calls, total time, mean and p99. The p99
+is taken from a uniform sample of at most SAMPLES calls per timer.
+
+start() is what flappy.py --timers and --profile use: it enables the
+timers and/or cProfile and, at exit, prints the report and writes the
+cProfile stats. These are in pstats format, which snakeviz, gprof2dot and
+flameprof (for flame graphs) read. With both on, hooked calls show up
+under the timers' wrapper in the stats.
+"""
+import atexit
+import cProfile
+import functools
+import random
+import sys
+from time import time
+
+SAMPLES = 100000
+
+# (module, function or Class.method, timer)
+HOOKS = [
+    ('collision', 'pixel_collision', 'pixel_collision'),
+    ('collision', 'PipeCollisionTable.collides_pipes', 'collision'),
+    ('physics', 'plain_step', 'step'),
+    ('sim', 'FlappySim.step', 'sim.step'),
+    ('node_util', 'getSuccessors', 'successors'),
+    ('node_util', 'getMacroSuccessors', 'successors'),
+    ('node_util', 'advance', 'advance'),
+    ('algs', 'Fringe.push', 'fringe.push'),
+    ('algs', 'Fringe.push_many', 'fringe.push_many'),
+    ('algs', 'Fringe.pop', 'fringe.pop'),
+    ('q_table', 'QTable.get', 'qtable.read'),
+    ('q_table', 'QTable.best', 'qtable.read'),
+    ('q_table', 'QTable.set', 'qtable.write'),
+    ('q_table', 'QTable.add', 'qtable.write'),
+    ('q_learner', 'QLearner.learn_from_episode', 'learn'),
+]
+
+
+class Timer:
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.samples = []
+        # its own generator, so sampling leaves the game's random state alone
+        self.rng = random.Random(0)
+
+    def add(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        if len(self.samples) < SAMPLES:
+            self.samples.append(seconds)
+        else:
+            slot = self.rng.randrange(self.calls)
+            if slot < SAMPLES:
+                self.samples[slot] = seconds
+
+    def percentile(self, p):
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, len(samples) * p // 100)] if samples else 0.0
+
+
+timers = {}
+_patched = []   # (owner, attribute, original)
+
+
+def hook(module, attribute, name):
+    """adds a function to instrument, e.g. one of a __main__ module"""
+    HOOKS.append((module, attribute, name))
+
+
+def _timed(function, timer):
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        start = time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timer.add(time() - start)
+    return timed
+
+
+def enable():
+    """instruments every hook whose module is imported"""
+    if _patched:
+        return
+    for module, attribute, name in HOOKS:
+        if module not in sys.modules:
+            continue
+        owner = sys.modules[module]
+        path = attribute.split('.')
+        for part in path[:-1]:
+            owner = getattr(owner, part)
+        # the function itself, not a bound or unbound method
+        original = owner.__dict__[path[-1]]
+        _patched.append((owner, path[-1], original))
+        setattr(owner, path[-1], _timed(original, timers.setdefault(name, Timer(name))))
+
+    # steps built from now on, and search's, go through the timed plain_step
+    if 'physics' in sys.modules:
+        physics = sys.modules['physics']
+        _patched.append((physics, 'INLINE', physics.INLINE))
+        physics.INLINE = False
+        node_util = sys.modules.get('node_util')
+        if getattr(node_util, 'STEP', None):
+            _patched.append((node_util, 'STEP', node_util.STEP))
+            node_util.STEP = physics.step_function(node_util.PIPE_TABLE)
+
+
+def disable():
+    """puts back the original functions"""
+    while _patched:
+        owner, attribute, original = _patched.pop()
+        setattr(owner, attribute, original)
+
+
+def reset():
+    timers.clear()
+
+
+def report():
+    """a table of every timer, by total time"""
+    lines = ['{:16} {:>10} {:>10} {:>10} {:>10}'.format('timer', 'calls', 'total s', 'mean us', 'p99 us')]
+    for timer in sorted(timers.values(), key=lambda timer: -timer.total):
+        if timer.calls:
+            lines.append('{:16} {:10} {:10.3f} {:10.2f} {:10.2f}'.format(
+                timer.name, timer.calls, timer.total, 1e6 * timer.total / timer.calls, 1e6 * timer.percentile(99)))
+    return '\n'.join(lines)
+
+
+def start(path=None, timed=True):
+    """enables the timers if timed and cProfile if path is given; at exit
+    prints report() and writes the cProfile stats to path"""
+    if timed:
+        enable()
+    profiler = None
+    if path:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    def finish():
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(path)
+        if timed:
+            disable()
+            print(report())
+        if profiler:
+            print('cProfile stats written to {}'.format(path))
+    atexit.register(finish)
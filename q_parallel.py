@@ -0,0 +1,143 @@
+"""Hogwild-style parallel Q-learning.
+
+train() runs headless episodes in several worker processes at once. Every
+worker has its own QLearner, FlappySim and exploration rate, but all of them
+read and write one QTable whose arrays live in shared memory: updates go
+straight into it, without locks, so a worker occasionally overwrites an
+update another made to the same entry at the same moment. The table is
+sparse in what each episode touches, so such collisions are rare.
+
+The shared arrays reach the workers as Process arguments, the one way
+multiprocessing hands shared memory to processes it spawns rather than
+forks, as on Windows; each worker wraps them in a QTable again.
+
+Workers follow QLearner's take_action/learn_from_episode contract through
+sim.run_episode, exactly as flappy.train_headless does.
+
+    python q_parallel.py scale [episodes]
+
+reports episodes and frames per second for 1, 2, 4 and 8 workers; frames
+per second is the fairer measure, as episodes get longer as agents learn.
+"""
+import ctypes
+import copy
+import multiprocessing
+import random
+import sys
+from time import time
+
+import numpy as np
+
+from collision import load_hitmasks
+from q_learner import QLearner
+from q_table import QTable
+import q_table
+from sim import FlappySim, run_episode
+
+
+def share(table):
+    """returns a copy of table whose values and seen flags are in shared
+    memory. Its buffers, passed to a Process as arguments, are visible to
+    and writable by that process; attach() makes a QTable of them there."""
+    buffers = (multiprocessing.RawArray(ctypes.c_double, table.values.size),
+               multiprocessing.RawArray(ctypes.c_bool, table.seen.size))
+    shared = attach(buffers, copy.copy(table))
+    shared.values[:] = table.values
+    shared.seen[:] = table.seen
+    return shared
+
+
+def attach(buffers, table=None):
+    """returns table, a new QTable by default, with its values and seen
+    flags replaced by views of the shared buffers of share()"""
+    table = table if table is not None else QTable()
+    values, seen = buffers
+    table.buffers = buffers
+    table.values = np.frombuffer(values).reshape(table.values.shape)
+    table.seen = np.frombuffer(seen, dtype=bool).reshape(table.seen.shape)
+    return table
+
+
+def epsilons(workers):
+    """exploration rate of every worker: the learner's own decaying schedule
+    for a single worker, otherwise spread geometrically from 0.05 down to
+    0.00005 so that some workers explore while others refine the greedy
+    policy. A flap at random is usually fatal, so rates stay low."""
+    if workers == 1:
+        return [None]
+    return [0.05 * 0.001 ** (float(i) / (workers - 1)) for i in range(workers)]
+
+
+def _work(worker, buffers, epsilon, counter, episodes, results, seed, options):
+    random.seed(seed * 1000 + worker)
+    table = attach(buffers)
+    learner = QLearner(epsilon=epsilon, **options)
+    learner.q_values = table
+    learner.reporting_interval = learner.dump_interval = learner.max_episodes = sys.maxint
+    sim = FlappySim(load_hitmasks(), rng=random.Random(seed * 1000 + worker))
+    while True:
+        with counter.get_lock():
+            if counter.value >= episodes:
+                break
+            counter.value += 1
+        score = run_episode(sim, learner)
+        results.put((worker, score, sim.frames, learner._get_current_epsilon(), len(table),
+                     learner.updates_per_second))
+    results.put((worker, None))
+
+
+def train(workers, episodes, table=None, seed=0, metrics=None, **options):
+    """plays episodes across workers, learning into table (a new one by
+    default); options go to every worker's QLearner. Every episode is
+    recorded to metrics, a MetricsSink, as it ends. Returns the table and a
+    dict of the scores, frames and seconds of the run."""
+    table = share(table if table is not None else QTable())
+    counter = multiprocessing.Value('l', 0)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_work, args=(
+        worker, table.buffers, epsilon, counter, episodes, results, seed, options))
+        for worker, epsilon in enumerate(epsilons(workers))]
+
+    start = time()
+    for process in processes:
+        process.start()
+    # drain the queue before joining; a worker with unread results never exits
+    scores = dict((worker, []) for worker in range(workers))
+    frames = running = played = 0
+    while running < workers:
+        result = results.get()
+        if result[1] is None:
+            running += 1
+            continue
+        worker, score, episode_frames, epsilon, states, updates_per_s = result
+        scores[worker].append(score)
+        frames += episode_frames
+        played += 1
+        if metrics:
+            metrics.record(episode=played, score=score,
+                           frames=episode_frames, epsilon=epsilon, states=states, updates_per_s=updates_per_s)
+    for process in processes:
+        process.join()
+    seconds = time() - start
+
+    scores = [score for worker in range(workers) for score in scores[worker]]
+    return table, {'scores': scores, 'frames': frames, 'seconds': seconds}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'scale':
+        episodes = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+        print('{} cpus, {} episodes from an empty table'.format(multiprocessing.cpu_count(), episodes))
+        print('{:8} {:>11} {:>11} {:>11}'.format('workers', 'episodes/s', 'frames/s', 'mean score'))
+        for workers in (1, 2, 4, 8):
+            _, run = train(workers, episodes)
+            print('{:8} {:11.1f} {:11.0f} {:11.2f}'.format(
+                workers, episodes / run['seconds'], run['frames'] / run['seconds'],
+                sum(run['scores']) / float(episodes)))
+    elif len(sys.argv) > 3 and sys.argv[1] == 'train':
+        table, run = train(int(sys.argv[2]), int(sys.argv[3]))
+        q_table.save(table, sys.argv[4] if len(sys.argv) > 4 else 'training/weights.qt', len(run['scores']))
+        print('{} episodes in {:.1f}s, best score {}'.format(len(run['scores']), run['seconds'], max(run['scores'])))
+    else:
+        print('usage: python q_parallel.py scale [episodes]')
+        print('       python q_parallel.py train workers episodes [path]')
@@ -0,0 +1,215 @@
+"""Dense Q-table over QLearner's discretized states.
+
+QLearner._extract_state buckets the game state into a small, finite space:
+x offsets in tens up to 100 and in hundreds beyond, y offsets in tens within
+100 of the gap and in hundreds beyond, and velocities in -10..10. QTable
+numbers every such state once, so Q-values live in an (n_states, 2) NumPy
+array indexed by an int instead of a dict keyed by str((state, action)).
+
+to_json() and from_json() convert to and from the string-keyed dicts that
+training/demo.json holds. Checkpoints are binary instead: a HEADER, then
+the values as little-endian float64 and the seen flags as bytes, written
+to a temporary file and renamed into place. load() maps the file
+copy-on-write, so pages are only read when touched. CheckpointWriter
+writes them from a background thread.
+
+    python q_table.py convert training/demo.json training/demo.qt
+"""
+import ast
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+import threading
+import Queue
+
+import numpy as np
+
+X_BUCKETS = tuple(range(-200, 101, 10)) + tuple(range(200, 1001, 100))
+Y_BUCKETS = tuple(range(-1000, -199, 100)) + tuple(range(-100, 101, 10)) + tuple(range(200, 1001, 100))
+VELOCITIES = tuple(range(-10, 11))
+ACTIONS = 2
+
+# magic, version, states, actions, episodes, digest of the buckets; padded
+# to 64 bytes so the values start aligned
+HEADER = struct.Struct('<4sIIII20s24x')
+MAGIC, VERSION = b'FBQT', 1
+SCHEME = hashlib.sha1(repr((X_BUCKETS, Y_BUCKETS, VELOCITIES, ACTIONS)).encode('ascii')).digest()
+
+
+class QTable:
+
+    def __init__(self):
+        self.states = [(x, y, vel) for x in X_BUCKETS for y in Y_BUCKETS for vel in VELOCITIES]
+        self.index = dict((state, i) for i, state in enumerate(self.states))
+        self.values = np.zeros((len(self.states), ACTIONS))
+        # entries that were ever set, which are the ones exported
+        self.seen = np.zeros((len(self.states), ACTIONS), dtype=bool)
+
+    def encode(self, state):
+        """the row of an (x, y, vel) state from QLearner._extract_state"""
+        return self.index[state]
+
+    def decode(self, index):
+        return self.states[index]
+
+    # item() and itemset() skip building NumPy scalars, which matters for
+    # the one-entry-at-a-time access of QLearner
+
+    def get(self, index, action):
+        return self.values.item(index, action)
+
+    def set(self, index, action, value):
+        self.values.itemset((index, action), value)
+        self.seen.itemset((index, action), True)
+
+    def add(self, indices, actions, deltas):
+        """adds deltas to many entries at once; repeated entries accumulate"""
+        flat, inverse = np.unique(indices * ACTIONS + actions, return_inverse=True)
+        values, seen = self.values.reshape(-1), self.seen.reshape(-1)
+        values[flat] += np.bincount(inverse, deltas)
+        seen[flat] = True
+
+    def best(self, index):
+        """the highest Q-value of a state"""
+        values = self.values
+        return max(values.item(index, 0), values.item(index, 1))
+
+    def __len__(self):
+        return int(np.count_nonzero(self.seen))
+
+    def to_json(self):
+        """{str((state, action)): value} for every entry that was set"""
+        return dict((str((self.states[index], int(action))), float(self.values[index, action]))
+                    for index, action in zip(*np.nonzero(self.seen)))
+
+    @classmethod
+    def from_json(cls, data):
+        table = cls()
+        # states that touched the ground have float y offsets ("-300.0") in
+        # old dumps; they share the row of the int bucket, which wins
+        for key, value in sorted(data.items(), key=lambda item: '.' not in item[0]):
+            state, action = ast.literal_eval(key)
+            table.set(table.encode(tuple(state)), action, value)
+        return table
+
+    def save(self, path, episodes=0):
+        """writes a binary checkpoint to path, atomically"""
+        _write(path, self.values, self.seen, episodes)
+
+    @classmethod
+    def load(cls, path):
+        """returns the QTable of a binary checkpoint, and sets its episodes"""
+        with open(path, 'rb') as infile:
+            magic, version, states, actions, episodes, scheme = HEADER.unpack(infile.read(HEADER.size))
+        table = cls()
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a Q-table checkpoint'.format(path))
+        if (states, actions) != table.values.shape or scheme != SCHEME:
+            raise ValueError('{} was saved with other state buckets'.format(path))
+        shape = table.values.shape
+        table.values = np.memmap(path, dtype='<f8', mode='c', offset=HEADER.size, shape=shape)
+        table.seen = np.memmap(path, dtype=bool, mode='c', offset=HEADER.size + table.values.nbytes, shape=shape)
+        table.episodes = episodes
+        return table
+
+
+def _write(path, values, seen, episodes):
+    # a temporary file of its own, as several processes may checkpoint at once
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.' + os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as outfile:
+            outfile.write(HEADER.pack(MAGIC, VERSION, values.shape[0], values.shape[1], episodes, SCHEME))
+            outfile.write(np.ascontiguousarray(values, dtype='<f8').tobytes())
+            outfile.write(np.ascontiguousarray(seen, dtype=bool).tobytes())
+        os.chmod(tmp, 0o644)
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)  # rename does not replace files on Windows
+        os.rename(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def load(path):
+    """returns the QTable saved at path, as JSON if path ends in .json"""
+    if path.endswith('.json'):
+        with open(path) as infile:
+            return QTable.from_json(json.load(infile))
+    return QTable.load(path)
+
+
+def save(table, path, episodes=0):
+    """saves table to path, as indented JSON if path ends in .json"""
+    if path.endswith('.json'):
+        dump = json.dumps(table.to_json(), sort_keys=True, indent=2, separators=(',', ': '))
+        with open(path, 'w') as outfile:
+            outfile.write(dump)
+    else:
+        table.save(path, episodes)
+
+
+class CheckpointWriter:
+    """writes binary checkpoints from a background thread. submit() only
+    copies the arrays; if the thread is still busy, a pending checkpoint
+    is replaced by the newer one. close() waits for the last write. A
+    write that fails stops the thread; its error is raised again by every
+    later submit() and by close()."""
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = Queue.Queue(maxsize=1)
+        self.error = None
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, table, episodes=0):
+        self._raise()
+        snapshot = (table.values.copy(), table.seen.copy(), episodes)
+        while True:
+            try:
+                self.pending.put_nowait(snapshot)
+                return
+            except Queue.Full:
+                try:
+                    self.pending.get_nowait()
+                except Queue.Empty:
+                    pass
+
+    def close(self):
+        # a dead thread never empties the queue
+        while self.thread.is_alive():
+            try:
+                self.pending.put(None, timeout=0.1)
+                break
+            except Queue.Full:
+                pass
+        self.thread.join()
+        self._raise()
+
+    def _raise(self):
+        if self.error:
+            raise self.error[0], self.error[1], self.error[2]
+
+    def _run(self):
+        while True:
+            snapshot = self.pending.get()
+            if snapshot is None:
+                return
+            try:
+                _write(self.path, *snapshot)
+            except Exception:
+                self.error = sys.exc_info()
+                return
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'convert':
+        print('usage: python q_table.py convert SOURCE DEST  (.json files are JSON, others binary)')
+        sys.exit(1)
+    source = load(sys.argv[2])
+    save(source, sys.argv[3], getattr(source, 'episodes', 0))
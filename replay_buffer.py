@@ -0,0 +1,85 @@
+"""Experience replay for QLearner.
+
+ReplayBuffer keeps the last `capacity` transitions of past episodes in
+fixed NumPy arrays used as a ring: the encoded state, the action, the
+reward and the encoded next state, -1 standing for the crash. QLearner
+adds every episode to it and then learns from a few sampled batches
+besides the episode itself, so transitions of long, late episodes are
+learned from more than once.
+
+Sampling is uniform, or with prioritized=True proportional to
+|TD error| ** alpha (Schaul et al., prioritized experience replay). New
+transitions get the largest priority seen so far, so each is sampled
+soon, and importance weights (N * P(i)) ** -beta, scaled to at most 1,
+correct for the bias of sampling by priority.
+"""
+import numpy as np
+
+CRASH = -1
+
+
+class ReplayBuffer:
+
+    def __init__(self, capacity=100000, prioritized=False, alpha=0.6, beta=0.4, seed=0):
+        self.capacity = capacity
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.beta = beta
+        self.rng = np.random.RandomState(seed)
+
+        self.states = np.zeros(capacity, dtype=np.intp)
+        self.actions = np.zeros(capacity, dtype=np.intp)
+        self.rewards = np.zeros(capacity)
+        self.next_states = np.zeros(capacity, dtype=np.intp)
+        self.priorities = np.zeros(capacity)
+        self.position = 0   # where the next transition goes
+        self.size = 0
+        self.max_priority = 1.0
+
+    def __len__(self):
+        return self.size
+
+    def add_episode(self, history, reward, penalty):
+        """adds the transitions of an episode of (state, action) pairs, the
+        last of which crashed"""
+        if not history:
+            return
+        states, actions = np.array(history, dtype=np.intp).T[:, -self.capacity:]
+        count = len(states)
+        next_states = np.empty(count, dtype=np.intp)
+        next_states[:-1] = states[1:]
+        next_states[-1] = CRASH
+        rewards = np.full(count, reward)
+        rewards[-1] = penalty
+
+        slots = (self.position + np.arange(count)) % self.capacity
+        self.states[slots] = states
+        self.actions[slots] = actions
+        self.rewards[slots] = rewards
+        self.next_states[slots] = next_states
+        self.priorities[slots] = self.max_priority
+        self.position = (self.position + count) % self.capacity
+        self.size = min(self.capacity, self.size + count)
+
+    def sample(self, batch_size):
+        """returns (slots, states, actions, rewards, next states, weights) of
+        batch_size transitions"""
+        if self.prioritized:
+            probabilities = self.priorities[:self.size] ** self.alpha
+            probabilities /= probabilities.sum()
+            slots = np.searchsorted(np.cumsum(probabilities), self.rng.random_sample(batch_size))
+            slots = np.minimum(slots, self.size - 1)
+            weights = (self.size * probabilities[slots]) ** -self.beta
+            weights /= weights.max()
+        else:
+            slots = self.rng.randint(0, self.size, batch_size)
+            weights = np.ones(batch_size)
+        return (slots, self.states[slots], self.actions[slots], self.rewards[slots], self.next_states[slots],
+                weights)
+
+    def update_priorities(self, slots, errors):
+        """sets the priorities of sampled transitions from their TD errors"""
+        if self.prioritized:
+            priorities = np.abs(errors) + 1e-6
+            self.priorities[slots] = priorities
+            self.max_priority = max(self.max_priority, priorities.max())
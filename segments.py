@@ -0,0 +1,192 @@
+"""Pipe-by-pipe search with a segment cache.
+
+Rather than one A* search to num_pipes, solve() runs one short search per
+pipe: from the first state with score k to the first state with score k+1.
+Within such a segment the bird can only touch the pipe it is about to pass
+and the ones it has not cleared yet, so the segment's solution depends on
+the bird's height and velocity relative to those pipes, not on where in the
+game they are. canonical_key keeps that geometry, in buckets: the bird's y
+against the gap ahead, the steps between consecutive gaps, the pipes' x
+against the bird and the velocity. It keys SEGMENT_CACHE, so a
+configuration is searched once and replayed from the cache afterwards,
+within a run and across runs. A bucket holds states that differ by a few
+pixels, so cached actions are replayed before they are used, and searched
+for again if they do not score from the state at hand.
+
+If a segment has no solution, the previous segments are dropped one at a
+time and the pipes since then solved in a single search instead.
+"""
+import json
+import os
+import sys
+import tempfile
+
+import algs
+import node_util
+import structs
+from collision import masks_key
+
+SEGMENT_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'training', 'segments.json')
+
+# bucket sizes of canonical_key: pixels of y and gap steps, pixels of pipe
+# x, and pixels per frame of velocity
+Y_BUCKET, X_BUCKET, VELOCITY_BUCKET = 16, 8, 4
+KEY_SCHEME = 'gap-relative {} {} {}'.format(Y_BUCKET, X_BUCKET, VELOCITY_BUCKET)
+
+
+class SegmentCache:
+    """canonical entry key -> actions string ('0' fall, '1' flap), stored in
+    a JSON file. Entries are discarded when the hitmasks they were solved
+    with or the key scheme change."""
+
+    def __init__(self, path=SEGMENT_CACHE):
+        self.path = path
+        self.masks = masks_key(node_util.HITMASKS).decode('ascii')
+        self.segments = {}
+        self.hits = self.misses = self.fallbacks = 0
+        self.dirty = False
+        if path and os.path.isfile(path):
+            with open(path) as infile:
+                data = json.load(infile)
+            if data.get('masks') == self.masks and data.get('key') == KEY_SCHEME:
+                self.segments = data['segments']
+
+    def get(self, key):
+        return self.segments.get(key)
+
+    def put(self, key, actions):
+        self.segments[key] = ''.join('1' if flapped else '0' for flapped in actions)
+        self.dirty = True
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def save(self):
+        if not (self.path and self.dirty):
+            return
+        # a temporary file of its own, as several processes may save at once
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', prefix='.segments.')
+        with os.fdopen(fd, 'w') as outfile:
+            json.dump({'masks': self.masks, 'key': KEY_SCHEME, 'segments': self.segments}, outfile)
+        os.chmod(tmp, 0o644)
+        if os.name == 'nt' and os.path.exists(self.path):
+            os.remove(self.path)  # rename does not replace files on Windows
+        os.rename(tmp, self.path)
+        self.dirty = False
+
+
+def canonical_key(state):
+    """the geometry a segment's solution depends on, bucketed: the bird's y
+    against the gap of the next pipe to pass, its velocity, and the x of
+    every pipe up to that one that the bird can still touch, with the
+    steps between their gaps"""
+    pipeWidth = node_util.IMAGES['pipe'][0].get_width()
+    playerMidPos = state.x + node_util.IMAGES['player'][0].get_width() / 2
+    xs, gaps = [], []
+    for x, k in state.pipes:
+        if x + pipeWidth > state.x:
+            xs.append((x - state.x) // X_BUCKET)
+            gaps.append(node_util.PIPES[k][0]['y'])
+        if x + pipeWidth / 2 > playerMidPos:
+            break
+    key = [(state.y - gaps[-1]) // Y_BUCKET, state.vely // VELOCITY_BUCKET] + xs + \
+        [(gap - previous) // Y_BUCKET for previous, gap in zip(gaps, gaps[1:])]
+    return ','.join(str(value) for value in key)
+
+
+def replay(state, actions):
+    """returns the state reached by taking actions from state, or None if the
+    bird crashes or cannot flap on the way"""
+    for flapped in actions:
+        state = node_util.advance(state, flapped)
+        if state is None or state.crashed:
+            return None
+    return state
+
+
+def _search(state, score, cost_function):
+    """A* from state to a state with the given score that has not crashed"""
+    return algs.search(structs.PriorityQueue, score, cost_function, start=state,
+                       goal=lambda state: state.score >= score and not state.crashed)
+
+
+def solve_segment(state, cache, cost_function):
+    """returns (actions, end state) from state to the first state with one
+    more point, or None if there is none"""
+    key = canonical_key(state)
+    cached = cache.get(key)
+    if cached is not None:
+        actions = [action == '1' for action in cached]
+        end = replay(state, actions)
+        if end is not None and end.score == state.score + 1:
+            cache.hits += 1
+            return actions, end
+    cache.misses += 1
+
+    found = _search(state, state.score + 1, cost_function)
+    if found is None:
+        return None
+    actions = found[0]
+    end = replay(state, actions)
+    cache.put(key, actions)
+    return actions, end
+
+
+def split(state, actions):
+    """splits actions taken from state into per-pipe segments; returns a list
+    of (actions, end state), one per point scored"""
+    segments, start = [], 0
+    for i, flapped in enumerate(actions):
+        state = node_util.advance(state, flapped)
+        if state.score > node_util.frameLayout(state.frame - 1).score:
+            segments.append((actions[start:i + 1], state))
+            start = i + 1
+    return segments
+
+
+def solve(num_pipes, cache=None, cost_function=None):
+    """returns (path, cache) solving num_pipes pipe by pipe, or (None, cache)
+    if the game cannot be solved. Call node_util.initialize() first."""
+    if cost_function is None:
+        cost_function = lambda successor: algs.heuristic(successor)
+    if cache is None:
+        cache = SegmentCache()
+
+    # entries[k] is the first state with score k, paths[k] the actions from it
+    entries = [node_util.getStart().state]
+    paths = []
+    while len(paths) < num_pipes:
+        segment = solve_segment(entries[-1], cache, cost_function)
+        if segment is not None:
+            paths.append(segment[0])
+            entries.append(segment[1])
+            continue
+
+        # dead end: solve from an earlier entry through the failed pipe, and
+        # cache the segments of that solution in place of the ones dropped
+        target = len(paths) + 1
+        while segment is None and paths:
+            paths.pop()
+            entries.pop()
+            cache.fallbacks += 1
+            found = _search(entries[-1], target, cost_function)
+            if found is not None:
+                segment = found[0]
+        if segment is None:
+            cache.save()
+            return None, cache
+        for actions, end in split(entries[-1], segment):
+            cache.put(canonical_key(entries[-1]), actions)
+            paths.append(actions)
+            entries.append(end)
+
+    cache.save()
+    return [flapped for actions in paths for flapped in actions], cache
+
+
+if __name__ == '__main__':
+    node_util.initialize()
+    path, cache = solve(int(sys.argv[1]) if len(sys.argv) > 1 else 450)
+    print('{} frames, cache hit rate {:.1%} ({} hits, {} misses, {} fallbacks)'.format(
+        len(path) if path is not None else None, cache.hit_rate(), cache.hits, cache.misses, cache.fallbacks))
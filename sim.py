@@ -0,0 +1,152 @@
+"""Headless Flappy Bird simulation.
+
+FlappySim plays the rules of physics.py with the pipe spawning and scoring
+of flappy.main_game, frame for frame, but never touches a surface, the event
+queue or the clock. flappy.main_game is a renderer on top of it, and agents
+can be trained through it at CPU speed with run_episode.
+"""
+from itertools import cycle
+import random
+
+from collision import pipe_table
+from physics import SCREENWIDTH, SCREENHEIGHT, PIPE_GAP_SIZE, BASE_Y, PLAYER_X, PLAYER_INDEX_CYCLE, \
+    pipeVelX, playerFlapAcc, can_flap, crashed, floor_y, step_function
+
+
+class FlappySim:
+    """One game of Flappy Bird. step() returns (observation, reward, done),
+    where the observation is the (x_offset, y_offset, y_vel) game state that
+    main_game hands to agents. Call reset() before the first step."""
+
+    def __init__(self, hitmasks, pipe_source=None, rng=None, reward=1.0, penalty=-1000.0):
+        """hitmasks is a dict of collision.Masks like flappy.HITMASKS;
+        pipe_source is a callable returning a new [upper, lower] pipe pair,
+        random pipes by default."""
+        self.hitmasks = hitmasks
+        self.pipe_table = pipe_table(hitmasks)
+        self.move_bird = step_function(self.pipe_table)
+        self.pipe_source = pipe_source or self.random_pipe
+        self.rng = rng or random
+        self.reward = reward
+        self.penalty = penalty
+
+        self.player_w = hitmasks['player'][0].width
+        self.player_h = hitmasks['player'][0].height
+        self.pipe_w = hitmasks['pipe'][0].width
+        self.pipe_h = hitmasks['pipe'][0].height
+        self.player_x = PLAYER_X
+        self.floor_y = floor_y(self.player_h)
+
+    def random_pipe(self):
+        """returns a randomly generated pipe, as flappy.get_random_pipe"""
+        # y of gap between upper and lower pipe
+        gap_y = self.rng.randrange(0, int(BASE_Y * 0.6 - PIPE_GAP_SIZE))
+        gap_y += int(BASE_Y * 0.2)
+        pipe_x = SCREENWIDTH + 10
+
+        return [
+            {'x': pipe_x, 'y': gap_y - self.pipe_h},  # upper pipe
+            {'x': pipe_x, 'y': gap_y + PIPE_GAP_SIZE},  # lower pipe
+        ]
+
+    def _next_pipe(self):
+        # pipe sources may hand out shared dicts (e.g. pipes.PIPES), which
+        # must not be moved in place
+        upper, lower = self.pipe_source()
+        return {'x': upper['x'], 'y': upper['y']}, {'x': lower['x'], 'y': lower['y']}
+
+    def reset(self, player_y=None, player_index_gen=None):
+        """starts a new game and returns its first observation"""
+        self.score = self.player_index = self.loop_iter = 0
+        self.player_index_gen = player_index_gen or cycle(PLAYER_INDEX_CYCLE)
+        if player_y is None:
+            player_y = int((SCREENHEIGHT - self.player_h) / 2)
+        self.player_y = player_y
+
+        # get 2 new pipes to add to upper_pipes lower_pipes list
+        new_pipe1 = self._next_pipe()
+        new_pipe2 = self._next_pipe()
+
+        self.upper_pipes = [
+            {'x': SCREENWIDTH + 200, 'y': new_pipe1[0]['y']},
+            {'x': SCREENWIDTH + 200 + (SCREENWIDTH // 2), 'y': new_pipe2[0]['y']},
+        ]
+
+        self.lower_pipes = [
+            {'x': SCREENWIDTH + 200, 'y': new_pipe1[1]['y']},
+            {'x': SCREENWIDTH + 200 + (SCREENWIDTH // 2), 'y': new_pipe2[1]['y']},
+        ]
+
+        self.player_vel_y = playerFlapAcc  # default same as player_flapped
+        self.crashed = self.ground_crash = False
+        # whether the bird's current position is a crash, which ends the
+        # game at the next step
+        self.hit = crashed(self.pipe_table, self.player_y, self.player_index, self.upper_pipes, self.lower_pipes)
+        self.frames = 0
+        return self.observe()
+
+    def observe(self):
+        """relative position of the next gap and the bird's vertical velocity"""
+        focus = self.lower_pipes[0] if self.lower_pipes[0]['x'] - self.player_x > -30 else self.lower_pipes[1]
+        return (focus['x'] - (self.player_x + self.player_w),
+                focus['y'] - PIPE_GAP_SIZE // 2 - (self.player_y + self.player_h // 2),
+                self.player_vel_y)
+
+    def step(self, action):
+        """advances the game by one frame. As in main_game, a crash is
+        detected at the start of the frame following the fatal move, in which
+        case the game is left untouched and done is True."""
+        flapped = action and can_flap(self.player_y, self.player_h)
+        if self.hit:
+            if flapped:
+                self.player_vel_y = playerFlapAcc
+            self.crashed = True
+            self.ground_crash = self.player_y >= self.floor_y
+            return self.observe(), self.penalty, True
+
+        # check for score
+        player_mid_pos = self.player_x + self.player_w // 2
+        for pipe in self.upper_pipes:
+            pipe_mid_pos = pipe['x'] + self.pipe_w // 2
+            if pipe_mid_pos <= player_mid_pos < pipe_mid_pos + 4:
+                self.score += 1
+
+        # player_index change
+        if (self.loop_iter + 1) % 3 == 0:
+            self.player_index = next(self.player_index_gen)
+        self.loop_iter = (self.loop_iter + 1) % 30
+
+        # move pipes to left
+        for u_pipe, l_pipe in zip(self.upper_pipes, self.lower_pipes):
+            u_pipe['x'] += pipeVelX
+            l_pipe['x'] += pipeVelX
+
+        # add new pipe when first pipe is about to touch left of screen
+        if 0 < self.upper_pipes[0]['x'] < 5:
+            new_pipe = self._next_pipe()
+            self.upper_pipes.append(new_pipe[0])
+            self.lower_pipes.append(new_pipe[1])
+
+        # remove first pipe if its out of the screen
+        if self.upper_pipes[0]['x'] < -self.pipe_w:
+            self.upper_pipes.pop(0)
+            self.lower_pipes.pop(0)
+
+        # player's movement, and the crash test of where it ends up. Pipes
+        # spawned or removed above are too far from the bird to matter.
+        self.player_y, self.player_vel_y, self.hit = self.move_bird(
+            self.player_y, self.player_vel_y, flapped, self.player_index, self.upper_pipes, self.lower_pipes)
+
+        self.frames += 1
+        return self.observe(), self.reward, False
+
+
+def run_episode(sim, agent):
+    """plays one headless game with agent and returns its score. The agent
+    sees the same observations, in the same order, as in main_game."""
+    game_state = sim.reset()
+    while True:
+        game_state, _, done = sim.step(agent.take_action(game_state))
+        if done:
+            agent.learn_from_episode()
+            return sim.score
@@ -1,4 +1,4 @@
-import heapq
+from collections import deque
 
 
 class Stack:
@@ -10,6 +10,10 @@ class Stack:
         "Push 'item' onto the stack"
         self.list.append(item)
 
+    def push_many(self, items):
+        "Push every item in 'items', in order"
+        self.list.extend(items)
+
     def pop(self):
         "Pop the most recently pushed item from the stack"
         return self.list.pop()
@@ -22,18 +26,22 @@ class Stack:
 class Queue:
     "A container with a first-in-first-out (FIFO) queuing policy."
     def __init__(self):
-        self.list = []
+        self.list = deque()
 
     def push(self,item):
         "Enqueue the 'item' into the queue"
-        self.list.insert(0,item)
+        self.list.append(item)
+
+    def push_many(self, items):
+        "Enqueue every item in 'items', in order"
+        self.list.extend(items)
 
     def pop(self):
         """
           Dequeue the earliest enqueued item still in the queue. This
           operation removes the item from the queue.
         """
-        return self.list.pop()
+        return self.list.popleft()
 
     def isEmpty(self):
         "Returns true if the queue is empty"
@@ -46,37 +54,124 @@ class PriorityQueue:
       has a priority associated with it and the client is usually interested
       in quick retrieval of the lowest-priority item in the queue. This
       data structure allows O(1) access to the lowest-priority item.
+
+      The heap is indexed: every entry knows its position, so push returns a
+      handle whose priority can be lowered in O(log n) with decrease, or
+      which can be dropped lazily with remove. update uses the handle of a
+      queued (hashable) item, so re-queued items never duplicate entries.
     """
+    # entry fields; entries are [priority, count, item, position] lists, which
+    # compare by (priority, count) as counts are unique
+    PRIORITY, COUNT, ITEM, POSITION = range(4)
+    REMOVED = object()  # placeholder item of lazily removed entries
+
     def  __init__(self):
         self.heap = []
         self.count = 0
+        self.live = 0
+        self.handles = {}
 
     def push(self, item, priority):
-        entry = (priority, self.count, item)
-        heapq.heappush(self.heap, entry)
+        "Adds item with the given priority; returns its handle"
+        entry = [priority, self.count, item, len(self.heap)]
+        self.heap.append(entry)
         self.count += 1
+        self.live += 1
+        self._siftUp(entry[self.POSITION])
+        try:
+            self.handles[item] = entry
+        except TypeError:
+            pass  # unhashable items can only be reached through their handle
+        return entry
 
     def pop(self):
-        (_, _, item) = heapq.heappop(self.heap)
+        while True:
+            entry = self._popRoot()
+            if entry[self.ITEM] is not self.REMOVED:
+                break
+        self.live -= 1
+        item = entry[self.ITEM]
+        try:
+            if self.handles.get(item) is entry:
+                del self.handles[item]
+        except TypeError:
+            pass
+        # a popped handle is dead, as a removed one is
+        entry[self.ITEM], entry[self.POSITION] = self.REMOVED, -1
         return item
 
     def isEmpty(self):
-        return len(self.heap) == 0
+        return self.live == 0
+
+    def __len__(self):
+        return self.live
+
+    def decrease(self, handle, priority):
+        "Lowers the priority of a queued entry, in O(log n); popped or removed ones are left alone"
+        if priority < handle[self.PRIORITY] and handle[self.ITEM] is not self.REMOVED:
+            handle[self.PRIORITY] = priority
+            self._siftUp(handle[self.POSITION])
+
+    def remove(self, handle):
+        "Drops a queued entry; it is skipped, not sifted out, when reached. Popped ones are left alone"
+        if handle[self.ITEM] is not self.REMOVED:
+            try:
+                if self.handles.get(handle[self.ITEM]) is handle:
+                    del self.handles[handle[self.ITEM]]
+            except TypeError:
+                pass
+            handle[self.ITEM] = self.REMOVED
+            self.live -= 1
 
     def update(self, item, priority):
-        # If item already in priority queue with higher priority, _update its priority and rebuild the heap.
+        # If item already in priority queue with higher priority, _update its priority.
         # If item already in priority queue with equal or lower priority, do nothing.
         # If item not in priority queue, do the same thing as self.push.
-        for index, (p, c, i) in enumerate(self.heap):
-            if i == item:
-                if p <= priority:
-                    break
-                del self.heap[index]
-                self.heap.append((priority, c, item))
-                heapq.heapify(self.heap)
-                break
-        else:
+        handle = self.handles.get(item)
+        if handle is None:
             self.push(item, priority)
+        else:
+            self.decrease(handle, priority)
+
+    def _siftUp(self, position):
+        heap, entry, POSITION = self.heap, self.heap[position], self.POSITION
+        while position > 0:
+            parent = (position - 1) >> 1
+            above = heap[parent]
+            if not entry < above:
+                break
+            heap[position] = above
+            above[POSITION] = position
+            position = parent
+        heap[position] = entry
+        entry[POSITION] = position
+
+    def _siftDown(self, position):
+        heap, entry, POSITION = self.heap, self.heap[position], self.POSITION
+        size = len(heap)
+        child = 2 * position + 1
+        while child < size:
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child += 1
+            below = heap[child]
+            if not below < entry:
+                break
+            heap[position] = below
+            below[POSITION] = position
+            position = child
+            child = 2 * position + 1
+        heap[position] = entry
+        entry[POSITION] = position
+
+    def _popRoot(self):
+        heap = self.heap
+        last = heap.pop()
+        if not heap:
+            return last
+        root = heap[0]
+        heap[0] = last
+        self._siftDown(0)
+        return root
 
 class PriorityQueueWithFunction(PriorityQueue):
     """
@@ -91,8 +186,8 @@ class PriorityQueueWithFunction(PriorityQueue):
         PriorityQueue.__init__(self)        # super-class initializer
 
     def push(self, item):
-        "Adds an item to the queue with priority from the priority function"
-        PriorityQueue.push(self, item, self.priorityFunction(item))
+        "Adds an item to the queue with priority from the priority function; returns its handle"
+        return PriorityQueue.push(self, item, self.priorityFunction(item))
 
 
 def manhattanDistance( xy1, xy2 ):